@@ -1,17 +1,25 @@
+import atexit
+import io
+import json
 import os
 import re
-import shutil
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
 from datetime import datetime
-from typing import Optional
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
 
 import typer
-import yaml
-from jinja2 import Environment, FileSystemLoader
-from pydantic import ValidationError
-from utils.atlassian import Atlassian
-from utils.gcal import GCal
-from utils.schema import CDModel, MOPModel
+from utils.cache import YAMLCache, validation_fingerprint
+from utils.templates import environment
+from utils.timing import PROFILER
+
+# utils.atlassian, utils.gcal and utils.schema pull in the Atlassian, Google API
+# and pydantic stacks. They are imported inside the commands that need them so
+# --render, --reset and --help start without paying for unused clients.
 
 mops = typer.Typer(
     add_completion=False,
@@ -19,64 +27,465 @@ mops = typer.Typer(
 Create MOP or Change Doc.
 """,
 )
+YAML_CACHE = YAMLCache()
+# commands the CLI hands to a running 'mops serve' daemon
+DAEMON_COMMANDS = ("mop", "cd", "batch")
+IN_DAEMON = False
 ARGUMENTS = {
+    "force": False,
     "link": False,
     "render": False,
     "default": False,
     "reset": False,
+    "queue": False,
+    "split": False,
+    "check_tickets": False,
 }
 
 
+@lru_cache(maxsize=None)
+def get_atlassian():
+    """Return the process-wide Atlassian client, kept warm by the daemon."""
+    from utils.atlassian import Atlassian
+
+    return Atlassian()
+
+
 def render_yaml(data, yaml_type: str):
     """Return rendered template."""
-    env = Environment(
-        loader=FileSystemLoader("renderers/"), trim_blocks=True, lstrip_blocks=True
-    )
-    template = env.get_template(f"{yaml_type}.j2")
-    return template.render(data)
+    with PROFILER.phase("render"):
+        template = environment("renderers").get_template(f"{yaml_type}.j2")
+        return template.render(data)
+
+
+def stream_yaml(data, yaml_type: str):
+    """Yield the rendered template in pieces as Jinja produces them."""
+    template = environment("renderers").get_template(f"{yaml_type}.j2")
+    yield from template.generate(data)
+
+
+def render_pages(data: dict, yaml_type: str, split: bool = False) -> tuple:
+    """Return (page body, child pages) to publish.
+
+    With split, a MOP is rendered as a parent page plus a [(title, body)]
+    child page per section, otherwise child pages is None.
+    """
+    if split and yaml_type == "mop":
+        from utils.render import split_mop
+
+        with PROFILER.phase("render"):
+            return split_mop(data)
+    return render_yaml(data, yaml_type), None
 
 
 def reset_yaml(repository: str, yaml_type: str, gcal_auth_path: Optional[str]):
     """Reset MOP or CD YAML files to defaults."""
-    env = Environment(
-        loader=FileSystemLoader("defaults/"), trim_blocks=True, lstrip_blocks=True
+    with PROFILER.phase("reset"):
+        template = environment("defaults").get_template(f"{yaml_type}_defaults.j2")
+        with open(f"{yaml_type}.yaml", "w") as f:
+            f.write(
+                template.render(repository=repository, gcal_auth_path=gcal_auth_path)
+            )
+
+
+def yaml_init(yaml_type: Optional[str] = None, path: Optional[str] = None):
+    """Return yaml file based on specified type, or from path if supplied.
+
+    Unchanged files are served from YAML_CACHE without re-parsing. Relative
+    jumper_source paths are resolved against the file's directory.
+    """
+    from utils.jumpers import resolve_sources
+
+    path = path or f"{yaml_type}.yaml"
+    with PROFILER.phase("load"):
+        data = YAML_CACHE.load(path)
+        return resolve_sources(data, os.path.dirname(os.path.abspath(path)))
+
+
+def yaml_paths(paths: list) -> list:
+    """Return sorted YAML file paths, expanding directories one level."""
+    found = []
+    for path in map(Path, paths):
+        children = path.iterdir() if path.is_dir() else [path]
+        found.extend(str(p) for p in children if p.suffix in (".yaml", ".yml"))
+    return sorted(found)
+
+
+def detect_yaml_type(data: dict) -> str:
+    """Return 'mop' or 'cd' based on the document's top-level keys."""
+    return "mop" if "sections" in data else "cd"
+
+
+def validate_yaml(data: dict, yaml_type: str, path: Optional[str] = None):
+    """Validate against schema for specified type.
+
+    If path is supplied and neither the file nor what its validation depends
+    on changed since it last passed, the schema check is skipped. With --check-tickets every
+    ticket must also exist in Jira.
+    """
+    fingerprint = None
+    if path:
+        with PROFILER.phase("jira_projects"):
+            fingerprint = validation_fingerprint(data)
+    if path and YAML_CACHE.is_valid(path, yaml_type, fingerprint):
+        # jumper_source files can change while the YAML does not
+        check_jumper_sources(data)
+    else:
+        from pydantic import ValidationError
+        from utils.schema import JIRA_PROJECTS, CDModel, MOPModel
+
+        with PROFILER.phase("jira_projects"):
+            JIRA_PROJECTS.get()
+        try:
+            with PROFILER.phase("validate"):
+                MOPModel(**data) if yaml_type == "mop" else CDModel(**data)
+        except ValidationError as e:
+            sys.exit(e)
+        if path:
+            YAML_CACHE.mark_valid(path, yaml_type, fingerprint)
+
+    if ARGUMENTS.get("check_tickets"):
+        check_tickets([data])
+
+
+def check_tickets(documents: list) -> None:
+    """Exit if a ticket referenced by any of documents does not exist.
+
+    Tickets of all documents are looked up together, in one Jira search for
+    those not already cached.
+    """
+    from utils.schema import JIRA_TICKETS, ticket_keys
+
+    keys = set().union(*(ticket_keys(data) for data in documents))
+    missing = JIRA_TICKETS.missing(keys)
+    if missing:
+        sys.exit(f"Jira tickets not found: {', '.join(sorted(missing))}")
+
+
+def check_jumper_sources(data: dict) -> None:
+    """Validate the files of a MOP's jumper_source steps, exit on error."""
+    from utils.jumpers import jumper_sources, step_table
+
+    for step in jumper_sources(data.get("sections") or {}):
+        try:
+            step_table(step)
+        except ValueError as e:
+            sys.exit(e)
+
+
+def page_url(page_title: str) -> str:
+    """Return Confluence URL for a page title."""
+    return (
+        "https://documentation.cenic.org/display/Core/"
+        f'{page_title.replace(" ", "+")}'
     )
-    template = env.get_template(f"{yaml_type}_defaults.j2")
-    with open(f"{yaml_type}.yaml", "w") as f:
-        f.write(template.render(repository=repository, gcal_auth_path=gcal_auth_path))
 
 
-def yaml_init(yaml_type: str):
-    """Return yaml file based on specified type."""
-    with open(f"{yaml_type}.yaml", "r") as f:
-        return yaml.safe_load(f)
+def jira_link_data(atlassian, ticket: str, parent_page_id, page_title: str) -> list:
+    """Return the [ticket, url, page title, page id] of a page's Jira link.
 
+    The page id comes from the ledger, so it is None before the first push.
+    """
+    page_id = atlassian.confluence_page_id(parent_page_id, page_title)
+    return [ticket, page_url(page_title), page_title, page_id]
 
-def validate_yaml(data: dict, yaml_type: str):
-    """Validate against schema for specified type."""
-    try:
-        MOPModel(**data) if yaml_type == "mop" else CDModel(**data)
-    except ValidationError as e:
-        sys.exit(e)
 
+def move_yaml(
+    page_title: str, repository: str, yaml_type: str, source: Optional[str] = None
+) -> None:
+    """Move YAML to designated repo's archive store.
 
-def move_yaml(page_title: str, repository: str, yaml_type: str) -> None:
-    """Move YAML to designated repo.
+    MOP jumper_source CSVs are stored along with the YAML.
 
     args:
       page_title: str
       repository: path
       yaml_type: str
+      source: path, defaults to the working {yaml_type}.yaml
     """
+    from utils.jumpers import inline_sources
+
+    source = source or working_yaml_path(yaml_type)
+    with open(source, "rb") as f:
+        content = f.read()
+    base_dir = os.path.dirname(os.path.abspath(source))
+    content = inline_sources(content, base_dir, YAML_CACHE.load(source))
+    archive_yaml(content, page_title, repository, yaml_type)
+
+
+def working_yaml_path(yaml_type: str) -> str:
+    """Return path of the working mop.yaml or cd.yaml archived by move_yaml."""
+    return f"{os.path.dirname(__file__)}/{yaml_type}.yaml"
+
+
+def archive_yaml(
+    content: bytes,
+    page_title: str,
+    repository: str,
+    yaml_type: str,
+    date: Optional[str] = None,
+) -> None:
+    """Store YAML content in the repo's archive store and index it.
+
+    args:
+      date: YYYY-MM-DD, defaults to today
+    """
+    from utils.archive import ArchiveStore
+
     # print(re.sub("[a-z]*@", "abc@", str))
     page_title = re.sub(r"/| ", "_", page_title)
     print(page_title)
+    date = date or datetime.today().strftime("%Y-%m-%d")
+    store = ArchiveStore(repository)
+    with PROFILER.phase("archive"):
+        entry = store.put_content(content, yaml_type, date, page_title)
+    index_archived(store, entry)
+
+
+def index_archived(store, entry: dict) -> None:
+    """Add an archived YAML to the search index, never failing the publish."""
+    from utils.index import ArchiveIndex
+
+    try:
+        with PROFILER.phase("index"), ArchiveIndex() as index:
+            index.add(store, entry)
+    except Exception as e:
+        print(f"\tUnable to index {entry['title']}: {e}")
+
+
+def default_repository() -> Optional[str]:
+    """Return the repository set in the working mop.yaml or cd.yaml."""
+    for yaml_type in ("mop", "cd"):
+        if os.path.exists(f"{yaml_type}.yaml"):
+            repository = (yaml_init(yaml_type) or {}).get("repository")
+            if repository:
+                return repository
+    return None
+
+
+def publish_steps(steps: dict) -> dict:
+    """Run independent publish steps concurrently.
+
+    End-to-end latency is that of the slowest step rather than the sum.
+
+    args:
+      steps: dict of step name: callable
+    Returns dict of step name: (success, return value or exception).
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(len(steps), 1)) as pool:
+        futures = {name: pool.submit(step) for name, step in steps.items()}
+        for name, future in futures.items():
+            try:
+                results[name] = (True, future.result())
+            except Exception as e:
+                results[name] = (False, e)
+    return results
+
+
+def publish_confluence(
+    atlassian,
+    parent_page_id,
+    page_title: str,
+    body: str,
+    children: Optional[list] = None,
+    force: bool = False,
+    yaml_type: Optional[str] = None,
+):
+    """Push a page, and its section child pages if the MOP was split.
+
+    With yaml_type, the page is recorded as published with the current
+    templates for 'mops rerender'. Returns False if an unsplit page was
+    unchanged, or for a split MOP a dict of page title: pushed.
+    """
+    if children is None:
+        result = atlassian.confluence_create_or_update(
+            [parent_page_id, page_title, body], force
+        )
+    else:
+        result = atlassian.confluence_publish_split(
+            parent_page_id, page_title, body, children, force
+        )
+    if yaml_type:
+        record_render(parent_page_id, page_title, yaml_type, body, children)
+    return result
+
+
+def record_render(
+    parent_page_id, page_title: str, yaml_type: str, body: str, children
+) -> None:
+    """Add a published page to the render log, never failing the publish."""
+    from utils.rerender import RenderLog, rendered_text
+
+    try:
+        with RenderLog() as log:
+            log.record(
+                parent_page_id,
+                page_title,
+                yaml_type,
+                rendered_text(body, children),
+                children is not None,
+            )
+    except Exception as e:
+        print(f"\tUnable to record render of {page_title}: {e}")
+
+
+def outbox_handlers() -> dict:
+    """Return outbox job kind: handler(payload, idempotency key)."""
+    return {
+        "confluence": lambda p, key: publish_confluence(
+            get_atlassian(),
+            p["parent_page_id"],
+            p["page_title"],
+            p["body"],
+            p.get("children"),
+            p["force"],
+            p.get("yaml_type"),
+        ),
+        # Jira links are reconciled and Google treats the key as the event
+        # id, so a retry after a lost response does not duplicate either. The
+        # job runs after the Confluence push, so the page id is known.
+        "jira_link": lambda p, key: get_atlassian().jira_reconcile_links(
+            [
+                jira_link_data(
+                    get_atlassian(),
+                    p["ticket"],
+                    p.get("parent_page_id"),
+                    p["page_title"],
+                )
+            ]
+        ),
+        "calendar": lambda p, key: create_calendar_event(
+            p["gcal_auth_path"], *p["event"], event_id=key[:32]
+        ),
+        "archive": lambda p, key: archive_yaml(
+            p["content"].encode(),
+            p["page_title"],
+            p["repository"],
+            p["yaml_type"],
+            p["date"],
+        ),
+    }
+
+
+def enqueue_publish(
+    yaml_type: str,
+    data: dict,
+    rendered_data: str,
+    link: bool = False,
+    calendar: bool = False,
+    force: bool = False,
+    children: Optional[list] = None,
+) -> list:
+    """Queue a document's publish steps in the outbox, returns job ids.
+
+    The Jira link and archive move wait for the Confluence push, the calendar
+    event does not. The working YAML is queued by content, along with its
+    jumper_source CSVs, so it may be reset before the archive job runs.
+    """
+    from utils.jumpers import inline_sources
+    from utils.outbox import Outbox, job_key
+
+    page_title = data["page_title"]
+    parent_page_id = data["parent_page_id"]
+    ticket = data["ticket"]
+    repository = os.path.abspath(data["repository"])
+    source = working_yaml_path(yaml_type)
+    with open(source, "rb") as f:
+        content = f.read()
+    content = inline_sources(
+        content, os.path.dirname(source), YAML_CACHE.load(source)
+    ).decode()
     date = datetime.today().strftime("%Y-%m-%d")
-    shutil.copy(
-        f"{os.path.dirname(__file__)}/{yaml_type}.yaml",
-        f"{repository}{yaml_type}/{date}_{page_title}.yaml",
+
+    # (kind, payload, idempotency key, runs after the Confluence push)
+    steps = [
+        (
+            "confluence",
+            {
+                "parent_page_id": parent_page_id,
+                "page_title": page_title,
+                "body": rendered_data,
+                "children": children,
+                "force": force,
+                "yaml_type": yaml_type,
+            },
+            job_key("confluence", parent_page_id, page_title, rendered_data, children),
+            False,
+        )
+    ]
+    if link:
+        url = page_url(page_title)
+        steps.append(
+            (
+                "jira_link",
+                {
+                    "ticket": ticket,
+                    "url": url,
+                    "parent_page_id": parent_page_id,
+                    "page_title": page_title,
+                },
+                job_key("jira_link", ticket, url),
+                True,
+            )
+        )
+    if calendar:
+        event = [
+            str(data["start_time"]),
+            str(data["end_time"]),
+            str(data["start_day"]),
+            f"{ticket}: {page_title}",
+        ]
+        steps.append(
+            (
+                "calendar",
+                {
+                    "gcal_auth_path": os.path.abspath(data["gcal_auth_path"]),
+                    "event": event,
+                },
+                job_key("calendar", *event),
+                False,
+            )
+        )
+    steps.append(
+        (
+            "archive",
+            {
+                "content": content,
+                "page_title": page_title,
+                "repository": repository,
+                "yaml_type": yaml_type,
+                "date": date,
+            },
+            job_key("archive", repository, yaml_type, date, page_title, content),
+            True,
+        )
     )
 
+    jobs = []
+    with Outbox() as outbox:
+        for kind, payload, key, after_confluence in steps:
+            after = jobs[0] if after_confluence else None
+            jobs.append(outbox.enqueue(kind, payload, key, after))
+    return jobs
+
+
+def start_outbox_worker() -> None:
+    """Drain the outbox in a detached process that outlives this command."""
+    import subprocess
+
+    from utils.cache import CACHE_DIR
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(CACHE_DIR / "outbox.log", "a") as log:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "outbox", "flush", "--wait"],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True,
+        )
+
 
 def main(yaml_type: str, data: dict, **kwargs):
     """Main function for CD, MOP gen.
@@ -84,7 +493,7 @@ def main(yaml_type: str, data: dict, **kwargs):
     Args:
       yaml_type: str = 'mop' or 'cd'
     kwargs:
-      reset, default, render, link: bool
+      reset, default, render, link, force, calendar, queue, split: bool
     """
     repository = data["repository"]
     gcal_auth_path = data.get("gcal_auth_path")
@@ -92,13 +501,21 @@ def main(yaml_type: str, data: dict, **kwargs):
         reset_yaml(repository, yaml_type, gcal_auth_path)
 
     else:
-        atlassian = Atlassian()
-        validate_yaml(data, yaml_type)
-        rendered_data = render_yaml(data, yaml_type)
+        validate_yaml(data, yaml_type, f"{yaml_type}.yaml")
 
         if kwargs["render"]:
-            print(rendered_data)
+            with PROFILER.phase("render"):
+                for chunk in stream_yaml(data, yaml_type):
+                    sys.stdout.write(chunk)
+            print()
         else:
+            rendered_data, children = render_pages(
+                data, yaml_type, kwargs.get("split", False)
+            )
+            calendar = kwargs.get("calendar", False)
+            if calendar and not gcal_auth_path:
+                raise ValueError("\n\ngcal_auth_path must be defined in cd.yaml.\n")
+
             page_title = data["page_title"]
             parent_page_id = data["parent_page_id"]
             ticket = data["ticket"]
@@ -108,22 +525,242 @@ def main(yaml_type: str, data: dict, **kwargs):
                 f"\n\tTicket: {ticket}",
                 f"\n\tJira Link: {kwargs['link']}\n",
             )
-            atlassian.confluence_create_or_update(
-                [parent_page_id, page_title, rendered_data]
-            )
+
+            if yaml_type == "cd":
+                warn_conflicts(data, gcal_auth_path if calendar else None)
+
+            if kwargs.get("queue"):
+                jobs = enqueue_publish(
+                    yaml_type,
+                    data,
+                    rendered_data,
+                    kwargs["link"],
+                    calendar,
+                    kwargs["force"],
+                    children,
+                )
+                start_outbox_worker()
+                print(
+                    f"\tQueued {len(jobs)} publish steps, "
+                    "see 'mops outbox status' for progress.\n"
+                )
+                if kwargs["default"]:
+                    gcal_auth_path = gcal_auth_path if yaml_type == "cd" else None
+                    reset_yaml(repository, yaml_type, gcal_auth_path)
+                return
+
+            atlassian = get_atlassian()
+
+            # the Jira link and calendar event only need the page title, so all
+            # remote side effects are issued together
+            steps = {
+                "Confluence": lambda: publish_confluence(
+                    atlassian,
+                    parent_page_id,
+                    page_title,
+                    rendered_data,
+                    children,
+                    kwargs["force"],
+                    yaml_type,
+                )
+            }
+            if kwargs["link"]:
+                print(f"\tAdding link to {ticket}")
+                # read before the push, which may record a first page id
+                link_data = jira_link_data(
+                    atlassian, ticket, parent_page_id, page_title
+                )
+                steps["Jira link"] = lambda: atlassian.jira_reconcile_links([link_data])
+            if calendar:
+                start_time = str(data["start_time"])
+                end_time = str(data["end_time"])
+                start_day = str(data["start_day"])
+                print(
+                    f"\tCreating Internal Change entry:\n\t\tDay: {start_day}",
+                    f"\n\t\tStart: {start_time}\n\t\tEnd: {end_time}\n",
+                )
+                steps["Calendar"] = lambda: create_calendar_event(
+                    gcal_auth_path,
+                    start_time,
+                    end_time,
+                    start_day,
+                    f"{ticket}: {page_title}",
+                )
+
+            results = publish_steps(steps)
+            for name, (ok, result) in results.items():
+                if not ok:
+                    detail = f"FAILED ({type(result).__name__}: {result})"
+                elif name == "Confluence" and isinstance(result, dict):
+                    pushed = sum(result.values())
+                    detail = f"OK, {pushed} of {len(result)} pages pushed"
+                elif name == "Confluence" and not result:
+                    detail = "unchanged, push skipped"
+                else:
+                    detail = "OK"
+                print(f"\t{name}: {detail}")
+            print()
+
+            if not results["Confluence"][0]:
+                sys.exit("Confluence push failed, YAML not moved to repo.")
             print(f"\tMoving YAML to repo: {repository}\n")
             gcal_auth_path = data["gcal_auth_path"] if yaml_type == "cd" else None
             move_yaml(page_title, repository, yaml_type)
             if kwargs["default"]:
                 reset_yaml(repository, yaml_type, gcal_auth_path)
+            if not all(ok for ok, _ in results.values()):
+                sys.exit(1)
 
-            if kwargs["link"]:
-                print(f"\tAdding link to {ticket}")
-                page_url = (
-                    "https://documentation.cenic.org/display/Core/"
-                    f'{page_title.replace(" ", "+")}'
-                )
-                atlassian.jira_create_link([ticket, page_url, page_title])
+
+def create_calendar_event(
+    gcal_auth_path: str, *event: str, event_id: Optional[str] = None
+) -> None:
+    """Build the Calendar service and insert one Internal Calendar event."""
+    from utils.gcal import GCal
+
+    GCal(gcal_auth_path).create_calendar_event(*event, event_id=event_id)
+
+
+def batch_file(
+    path: str,
+    atlassian,
+    link: bool,
+    render: bool,
+    force: bool = False,
+    links: Optional[list] = None,
+) -> str:
+    """Validate, render and publish a single YAML for batch mode.
+
+    Returns the page title. Errors are raised to the caller, including the
+    SystemExit raised by validate_yaml. If links is supplied the Jira link is
+    appended to it, to be reconciled with the rest of the batch, instead of
+    made here.
+    """
+    data = yaml_init(path=path)
+    yaml_type = detect_yaml_type(data)
+    validate_yaml(data, yaml_type, path)
+    rendered_data = render_yaml(data, yaml_type)
+    page_title = data["page_title"]
+    if render:
+        return page_title
+
+    pushed = publish_confluence(
+        atlassian,
+        data["parent_page_id"],
+        page_title,
+        rendered_data,
+        force=force,
+        yaml_type=yaml_type,
+    )
+    move_yaml(page_title, data["repository"], yaml_type, source=path)
+    if link:
+        link_data = jira_link_data(
+            atlassian, data["ticket"], data["parent_page_id"], page_title
+        )
+        if links is None:
+            atlassian.jira_reconcile_links([link_data])
+        else:
+            links.append(link_data)
+    return page_title if pushed else f"{page_title} (unchanged)"
+
+
+def batch_publish(
+    paths: list,
+    atlassian,
+    workers: int,
+    link: bool = False,
+    render: bool = False,
+    force: bool = False,
+) -> dict:
+    """Run batch_file over paths with a bounded thread pool.
+
+    Jira links of every published file are then reconciled in one pass.
+    Returns a dict of path: (success, page title or error message).
+    """
+    from utils.schema import JIRA_PROJECTS
+
+    # warm the project cache once rather than from every worker
+    JIRA_PROJECTS.get()
+    if ARGUMENTS.get("check_tickets"):
+        # one search for the whole batch, files with missing tickets then
+        # fail their own validation from the cache
+        documents = []
+        for path in paths:
+            try:
+                documents.append(yaml_init(path=path))
+            except Exception:
+                # reported when the file itself is published
+                pass
+        try:
+            check_tickets([data for data in documents if isinstance(data, dict)])
+        except SystemExit:
+            pass
+        except Exception as e:
+            print(
+                f"\tUnable to look up batch tickets ({type(e).__name__}: {e}), "
+                "checking each file instead."
+            )
+    results = {}
+    links: list = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            path: pool.submit(batch_file, path, atlassian, link, render, force, links)
+            for path in paths
+        }
+        for path, future in futures.items():
+            try:
+                results[path] = (True, future.result())
+            except SystemExit as e:
+                results[path] = (False, str(e.code))
+            except Exception as e:
+                results[path] = (False, f"{type(e).__name__}: {e}")
+    if links:
+        try:
+            counts = atlassian.jira_reconcile_links(links, workers)
+        except Exception as e:
+            print(f"\tJira links FAILED ({type(e).__name__}: {e})")
+        else:
+            print(
+                f"\tJira links: {counts['created']} created, "
+                f"{counts['updated']} updated, {counts['unchanged']} unchanged"
+            )
+    return results
+
+
+@mops.command()
+def batch(
+    directory: Path = typer.Argument(
+        ..., exists=True, file_okay=False, help="Directory of MOP/CD YAML files."
+    ),
+    workers: int = typer.Option(
+        4,
+        "--workers",
+        "-w",
+        min=1,
+        help="Maximum concurrent documents, keeps Confluence under rate limits.",
+    ),
+) -> None:
+    """Validate, render and publish every YAML in a directory."""
+    paths = yaml_paths([directory])
+    if not paths:
+        sys.exit(f"No YAML files found in {directory}")
+
+    atlassian = None if ARGUMENTS["render"] else get_atlassian()
+    results = batch_publish(
+        paths,
+        atlassian,
+        workers,
+        ARGUMENTS["link"],
+        ARGUMENTS["render"],
+        ARGUMENTS["force"],
+    )
+
+    failed = [path for path, (ok, _) in results.items() if not ok]
+    print(f"\nBatch: {len(paths) - len(failed)} succeeded, {len(failed)} failed\n")
+    for path, (ok, detail) in results.items():
+        print(f"\t{'OK' if ok else 'FAILED':<8}{os.path.basename(path)}: {detail}")
+    if failed:
+        raise typer.Exit(code=1)
 
 
 @mops.command()
@@ -144,30 +781,710 @@ def cd(
 ) -> None:
     """Create Change Doc from cd.yaml"""
     data = yaml_init("cd")
-    main("cd", data, **ARGUMENTS)
+    main("cd", data, calendar=calendar, **ARGUMENTS)
 
-    if calendar:
-        if not data["gcal_auth_path"]:
-            raise ValueError("\n\ngcal_auth_path must be defined in cd.yaml.\n")
-        start_time = str(data["start_time"])
-        end_time = str(data["end_time"])
-        start_day = str(data["start_day"])
+
+@mops.command()
+def calendar(
+    paths: List[Path] = typer.Argument(
+        ..., exists=True, help="Change Doc YAML files or directories of them."
+    ),
+) -> None:
+    """Create Internal Calendar entries for many Change Docs at once.
+
+    Events are inserted through batch requests, and events already on the
+    calendar with the same title and start time are skipped.
+    """
+    from utils.gcal import GCal
+
+    events = {}
+    for path in yaml_paths(paths):
+        data = yaml_init(path=path)
+        if detect_yaml_type(data) != "cd" or not data.get("start_time"):
+            print(f"\tSkipping {os.path.basename(path)}: no change window.")
+            continue
+        if not data.get("gcal_auth_path"):
+            sys.exit(f"gcal_auth_path must be defined in {path}.")
+        event = (
+            str(data["start_time"]),
+            str(data["end_time"]),
+            str(data["start_day"]),
+            f"{data['ticket']}: {data['page_title']}",
+        )
+        events.setdefault(data["gcal_auth_path"], []).append(event)
+
+    for gcal_auth_path, gcal_events in events.items():
+        results = GCal(gcal_auth_path).create_calendar_events(gcal_events)
+        for (start_time, end_time, start_day, title), result in zip(
+            gcal_events, results
+        ):
+            print(f"\t{start_day} {start_time}-{end_time} {title}: {result}")
+
+
+@mops.command()
+def watch(
+    yaml_type: str = typer.Argument("mop", help="Document to watch, 'mop' or 'cd'."),
+    output: Optional[Path] = typer.Option(
+        None, "--output", "-o", help="Write the render to a file instead of printing."
+    ),
+    interval: float = typer.Option(
+        0.2, "--interval", "-i", help="Seconds between checks for changes."
+    ),
+) -> None:
+    """Re-render mop.yaml or cd.yaml each time it is saved.
+
+    MOP sections whose YAML is unchanged are reused from the previous render.
+    """
+    from utils.render import IncrementalRenderer
+
+    if yaml_type not in ("mop", "cd"):
+        sys.exit("yaml_type must be 'mop' or 'cd'.")
+    path = f"{yaml_type}.yaml"
+    renderer = IncrementalRenderer()
+    last = None
+    print(f"Watching {path}, Ctrl-C to stop.")
+    try:
+        while True:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # editors may replace the file rather than write it in place
+                stat = None
+            if stat and (stat.st_mtime_ns, stat.st_size) != last:
+                last = (stat.st_mtime_ns, stat.st_size)
+                start = time.perf_counter()
+                try:
+                    data = yaml_init(yaml_type)
+                    validate_yaml(data, yaml_type, path)
+                    if yaml_type == "mop":
+                        rendered_data = renderer.render(data)
+                        sections = f", {renderer.rendered} of "
+                        sections += f"{renderer.rendered + renderer.reused} sections"
+                    else:
+                        rendered_data = render_yaml(data, yaml_type)
+                        sections = ""
+                except SystemExit as e:
+                    print(f"\n{e.code}\n")
+                except Exception as e:
+                    print(f"\n{type(e).__name__}: {e}\n")
+                else:
+                    if output:
+                        output.write_text(rendered_data)
+                    else:
+                        print(rendered_data)
+                    elapsed = (time.perf_counter() - start) * 1000
+                    print(f"\n\tRendered in {elapsed:.1f} ms{sections}\n")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+@mops.command()
+def search(
+    query: str = typer.Argument(
+        ...,
+        help="Ticket, device, port, cage, rack, cable, label or CID. '*' wildcards.",
+    ),
+    kind: Optional[str] = typer.Option(
+        None, "--kind", "-k", help="Only match this kind, ex. 'device' or 'ticket'."
+    ),
+    repository: Optional[str] = typer.Option(
+        None,
+        "--repository",
+        help="Archive to index, defaults to the repository in mop.yaml or cd.yaml.",
+    ),
+    update: bool = typer.Option(
+        True, "--update/--no-update", help="Index new or changed archive files first."
+    ),
+) -> None:
+    """Search archived MOPs and Change Docs."""
+    from utils.archive import ArchiveStore
+    from utils.index import ArchiveIndex
+
+    repository = repository or default_repository()
+    with ArchiveIndex() as index:
+        if update and repository:
+            indexed, removed = index.update(ArchiveStore(repository))
+            if indexed or removed:
+                print(f"\tIndexed {indexed}, removed {removed} archived documents.\n")
+        rows = index.search(query, kind)
+
+    if not rows:
+        sys.exit(f"No archived documents reference '{query}'.")
+    for date, yaml_type, title, ref_kind, value in rows:
+        print(f"{date}  {yaml_type.upper():<4}{title}  [{ref_kind}: {value}]")
+
+
+def change_conflicts(
+    window: tuple,
+    refs: set,
+    repository: Optional[str] = None,
+    gcal_auth_path: Optional[str] = None,
+    exclude: Optional[str] = None,
+) -> tuple:
+    """Return (archived changes, calendar events) overlapping window.
+
+    args:
+      window: (start, end) as 'YYYY-MM-DDTHH:MM', see index.change_window
+      refs: (kind, value) pairs, archived changes sharing a device or rack
+        are marked
+      repository: archive to bring the index up to date with first
+      gcal_auth_path: also check Internal Calendar events, cached briefly
+      exclude: archived title to skip, ex. the CD being republished
+    """
+    from utils.archive import ArchiveStore
+    from utils.index import ArchiveIndex
+
+    start, end = window
+    with PROFILER.phase("conflicts"), ArchiveIndex() as index:
+        if repository:
+            index.update(ArchiveStore(repository))
+        changes = [
+            row for row in index.overlapping(start, end, refs) if row[2] != exclude
+        ]
+        events = []
+        if gcal_auth_path:
+            from utils.gcal import GCal
+
+            gcal = GCal(gcal_auth_path)
+            day = datetime.fromisoformat(start).date()
+            events = [
+                event
+                for event in index.calendar_events(day, gcal.day_windows)
+                if event[1] < end and event[2] > start
+            ]
+    return changes, events
+
+
+def print_conflicts(changes: list, events: list) -> None:
+    for date, yaml_type, title, start, end, shared in changes:
+        conflict = f"  CONFLICT [{', '.join(shared)}]" if shared else ""
         print(
-            f"\tCreating Internal Change entry:\n\t\tDay: {start_day}",
-            f"\n\t\tStart: {start_time}\n\t\tEnd: {end_time}\n",
+            f"\t\t{start.replace('T', ' ')} - {end[11:]}  "
+            f"{yaml_type.upper():<4}{title}{conflict}"
+        )
+    for summary, start, end in events:
+        print(f"\t\t{start.replace('T', ' ')} - {end[11:]}  CAL {summary}")
+
+
+def warn_conflicts(data: dict, gcal_auth_path: Optional[str] = None) -> None:
+    """Print changes scheduled in the same window as a CD, never failing it."""
+    from utils.index import change_window, document_refs
+
+    window = change_window(data)
+    if not window:
+        return
+    try:
+        changes, events = change_conflicts(
+            window,
+            document_refs(data),
+            data["repository"],
+            gcal_auth_path,
+            re.sub(r"/| ", "_", data["page_title"]),
+        )
+    except Exception as e:
+        print(f"\tUnable to check for conflicting changes: {e}\n")
+        return
+    if changes or events:
+        print("\tWARNING: other changes are scheduled in this window:")
+        print_conflicts(changes, events)
+        print()
+
+
+@mops.command()
+def conflicts(
+    day: Optional[str] = typer.Option(
+        None, "--day", help="YYYY-MM-DD, defaults to start_day in cd.yaml."
+    ),
+    start: Optional[str] = typer.Option(
+        None, "--start", help="HHMM, defaults to start_time in cd.yaml."
+    ),
+    end: Optional[str] = typer.Option(
+        None, "--end", help="HHMM, defaults to end_time in cd.yaml."
+    ),
+    devices: List[str] = typer.Option(
+        [], "--device", "-D", help="Device to mark conflicts for, repeatable."
+    ),
+    racks: List[str] = typer.Option(
+        [], "--rack", help="Rack to mark conflicts for, repeatable."
+    ),
+    repository: Optional[str] = typer.Option(
+        None,
+        "--repository",
+        help="Archive to index, defaults to the repository in mop.yaml or cd.yaml.",
+    ),
+    calendar: bool = typer.Option(
+        False, "--calendar", "-c", help="Also list Internal Calendar events."
+    ),
+) -> None:
+    """List archived changes scheduled in a window.
+
+    Changes sharing a device or rack with cd.yaml, or with --device/--rack,
+    are marked as conflicts.
+    """
+    from utils.index import change_window, document_refs
+
+    data = yaml_init("cd") if os.path.exists("cd.yaml") else {}
+    data = dict(data or {})
+    if day or start or end:
+        data.update(
+            {
+                k: v
+                for k, v in (
+                    ("start_day", day),
+                    ("start_time", start),
+                    ("end_time", end),
+                )
+                if v
+            }
         )
-        gcal = GCal(data["gcal_auth_path"])
-        title = data["ticket"] + ": " + data["page_title"]
-        gcal.create_calendar_event(start_time, end_time, start_day, title)
+    window = change_window(data)
+    if not window:
+        sys.exit("A day, start and end time are needed, from cd.yaml or options.")
+    refs = document_refs(data) if data.get("changes") else set()
+    refs |= {("device", d.strip().lower()) for d in devices}
+    refs |= {("rack", r.strip().lower()) for r in racks}
+
+    changes, events = change_conflicts(
+        window,
+        refs,
+        repository or default_repository(),
+        data.get("gcal_auth_path") if calendar else None,
+    )
+    if not changes and not events:
+        print(f"No changes scheduled from {window[0]} to {window[1]}.")
+        return
+    print(f"Scheduled from {window[0]} to {window[1]}:")
+    print_conflicts(changes, events)
+
+
+archive = typer.Typer(help="List, restore and import archived MOPs and CDs.")
+mops.add_typer(archive, name="archive")
+
+
+def archive_store(repository: Optional[str]):
+    """Return ArchiveStore for repository, or the working YAML's repository."""
+    from utils.archive import ArchiveStore
+
+    repository = repository or default_repository()
+    if not repository:
+        sys.exit("No repository given or set in mop.yaml or cd.yaml.")
+    return ArchiveStore(repository)
+
+
+REPOSITORY_OPTION = typer.Option(
+    None,
+    "--repository",
+    help="Archive repository, defaults to the repository in mop.yaml or cd.yaml.",
+)
+
+
+@archive.command("list")
+def archive_list(
+    title: Optional[str] = typer.Argument(None, help="Only titles containing this."),
+    yaml_type: Optional[str] = typer.Option(None, "--type", "-t", help="mop or cd."),
+    repository: Optional[str] = REPOSITORY_OPTION,
+) -> None:
+    """List archived documents, oldest first."""
+    for entry in archive_store(repository).entries(yaml_type):
+        if not title or title.lower() in entry["title"].lower():
+            print(f"{entry['date']}  {entry['yaml_type'].upper():<4}{entry['title']}")
+
+
+@archive.command("restore")
+def archive_restore(
+    title: str = typer.Argument(..., help="Archived page title."),
+    date: Optional[str] = typer.Option(
+        None, "--date", help="YYYY-MM-DD, defaults to the latest."
+    ),
+    yaml_type: Optional[str] = typer.Option(None, "--type", "-t", help="mop or cd."),
+    output: Optional[str] = typer.Option(
+        None, "--output", "-o", help="Destination, defaults to mop.yaml or cd.yaml."
+    ),
+    repository: Optional[str] = REPOSITORY_OPTION,
+) -> None:
+    """Restore an archived document, ex. back to mop.yaml."""
+    store = archive_store(repository)
+    entry = store.find(title, date, yaml_type)
+    if not entry:
+        sys.exit(f"No archived document titled '{title}'.")
+    output = output or f"{entry['yaml_type']}.yaml"
+    store.restore(entry, output)
+    print(f"\tRestored {entry['date']} {entry['title']} to {output}")
+
+
+@archive.command("import")
+def archive_import(repository: Optional[str] = REPOSITORY_OPTION) -> None:
+    """Import the flat {repository}mop/ and cd/ folders into the store."""
+    store = archive_store(repository)
+    print(f"\tImported {store.import_flat()} documents into {store.root}")
+
+
+@mops.command()
+def report(
+    repositories: Optional[List[str]] = typer.Argument(
+        None, help="Archives to report on, defaults to the repository in cd/mop.yaml."
+    ),
+    output_format: str = typer.Option(
+        "table", "--format", "-f", help="table, csv or json."
+    ),
+    output: Optional[Path] = typer.Option(
+        None, "--output", "-o", help="Write to this file instead of the terminal."
+    ),
+    workers: int = typer.Option(
+        os.cpu_count() or 1, "--workers", "-w", min=1, help="Worker processes."
+    ),
+) -> None:
+    """Report changes per month, department, level and site from the archive.
+
+    Statistics of each archived document are cached, so re-runs only read
+    documents archived since.
+    """
+    import csv
+
+    from utils.report import build_report
+
+    if output_format not in ("table", "csv", "json"):
+        sys.exit("--format must be table, csv or json.")
+    repositories = repositories or [default_repository()]
+    if not all(repositories):
+        sys.exit("No repository given or set in mop.yaml or cd.yaml.")
+    with PROFILER.phase("report"):
+        result, read = build_report(map(archive_store, repositories), workers)
+
+    with open(output, "w", newline="") if output else io.StringIO() as f:
+        if output_format == "json":
+            json.dump(result.as_dict(), f, indent=2)
+            f.write("\n")
+        elif output_format == "csv":
+            writer = csv.writer(f)
+            writer.writerow(["metric", "key", "value"])
+            writer.writerows(result.rows())
+        else:
+            print(f"Documents: {result.documents} ({read} read)", file=f)
+            for metric, counts in result.as_dict().items():
+                if isinstance(counts, dict) and counts:
+                    print(f"\n{metric.replace('_', ' ').capitalize()}:", file=f)
+                    for key, value in counts.items():
+                        print(f"\t{key:<24}{value:>8}", file=f)
+        if not output:
+            print(f.getvalue(), end="")
+    if output:
+        print(f"\tReport of {result.documents} documents written to {output}")
+
+
+@mops.command()
+def rerender(
+    repositories: Optional[List[str]] = typer.Argument(
+        None, help="Archives to re-render, defaults to the repository in cd/mop.yaml."
+    ),
+    yaml_type: Optional[str] = typer.Option(None, "--type", "-t", help="mop or cd."),
+    rerender_all: bool = typer.Option(
+        False,
+        "--all",
+        help="Re-render every document, not only those published with older "
+        "templates.",
+    ),
+    dry_run: bool = typer.Option(
+        False, "--dry-run", "-n", help="List changed pages without pushing them."
+    ),
+    workers: int = typer.Option(
+        os.cpu_count() or 1, "--workers", "-w", min=1, help="Render processes."
+    ),
+    concurrency: int = typer.Option(
+        4, "--concurrency", "-j", min=1, help="Pages pushed to Confluence at once."
+    ),
+) -> None:
+    """Re-render archived documents after a template change.
+
+    Only the latest version of each document whose page was published with
+    older templates is rendered, and only pages whose output changed are
+    pushed again.
+    """
+    from utils.rerender import RenderLog, diff_stats, render_stale, rendered_text
+
+    repositories = repositories or [default_repository()]
+    if not all(repositories):
+        sys.exit("No repository given or set in mop.yaml or cd.yaml.")
+    latest = {}
+    for store in map(archive_store, repositories):
+        for entry in store.entries(yaml_type):
+            latest[(store.root, entry["yaml_type"], entry["title"])] = (store, entry)
+    documents = [
+        (entry["title"], store.read(entry), entry["yaml_type"])
+        for store, entry in latest.values()
+    ]
+
+    changed = []
+    unchanged = failed = 0
+    with RenderLog() as log:
+        with PROFILER.phase("render"):
+            for page in render_stale(documents, log.templates(), workers, rerender_all):
+                if "error" in page:
+                    failed += 1
+                    print(f"\tFAILED  {page['title']}: {page['error']}")
+                    continue
+                text = rendered_text(page["body"], page["children"])
+                previous = log.body(page["parent_page_id"], page["page_title"])
+                if text == previous:
+                    # only the templates changed, not this page's output
+                    unchanged += 1
+                    if not dry_run:
+                        log.record(
+                            page["parent_page_id"],
+                            page["page_title"],
+                            page["yaml_type"],
+                            text,
+                            page["split"],
+                        )
+                    continue
+                if previous is None:
+                    detail = "no earlier render recorded"
+                else:
+                    detail = "+{} -{} lines".format(*diff_stats(previous, text))
+                print(f"\t{'CHANGED':<8}{page['page_title']}: {detail}")
+                changed.append(page)
+
+    print(
+        f"\nRe-render: {len(changed)} changed, {unchanged} unchanged, "
+        f"{failed} failed, {len(documents) - len(changed) - unchanged - failed} "
+        "already current\n"
+    )
+    if dry_run or not changed:
+        return
+
+    atlassian = get_atlassian()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {
+            page["page_title"]: pool.submit(
+                publish_confluence,
+                atlassian,
+                page["parent_page_id"],
+                page["page_title"],
+                page["body"],
+                page["children"],
+                False,
+                page["yaml_type"],
+            )
+            for page in changed
+        }
+        for page_title, future in futures.items():
+            try:
+                future.result()
+                print(f"\t{'OK':<8}{page_title}")
+            except Exception as e:
+                print(f"\t{'FAILED':<8}{page_title}: {type(e).__name__}: {e}")
+
+
+outbox = typer.Typer(help="Inspect and drain publish steps queued with --queue.")
+mops.add_typer(outbox, name="outbox")
+
+
+@outbox.command("status")
+def outbox_status(
+    all_jobs: bool = typer.Option(
+        False, "--all", "-a", help="Include finished jobs from the last week."
+    ),
+) -> None:
+    """List queued publish steps."""
+    from utils.outbox import Outbox
+
+    with Outbox() as queue:
+        jobs = queue.jobs(include_done=all_jobs)
+    if not jobs:
+        print("\tOutbox is empty.")
+    for job in jobs:
+        title = json.loads(job["payload"]).get("page_title", "")
+        detail = f"{job['status']}, {job['attempts']} failed attempts"
+        if job["status"] == "pending" and job["attempts"]:
+            retry = datetime.fromtimestamp(job["next_attempt"]).strftime("%H:%M:%S")
+            detail += f", retry at {retry}"
+        elif job["status"] == "pending" and job["after"]:
+            detail += f", after job {job['after']}"
+        print(f"{job['id']:>5}  {job['kind']:<11}{title}: {detail}")
+        if job["error"] and job["status"] != "done":
+            print(f"\t{job['error']}")
+
+
+@outbox.command("flush")
+def outbox_flush(
+    wait: bool = typer.Option(
+        False, "--wait", help="Keep retrying until no queued step can still run."
+    ),
+) -> None:
+    """Run queued publish steps that are due."""
+    from utils.outbox import POLL, Outbox
+
+    with Outbox() as queue:
+        while True:
+            with queue.worker_lock() as locked:
+                if not locked:
+                    print("\tAnother outbox worker is running queued steps.")
+                    return
+                while True:
+                    counts = queue.flush(outbox_handlers())
+                    if any(counts.values()):
+                        print(
+                            f"\t{datetime.now():%Y-%m-%d %H:%M:%S} "
+                            f"done {counts['done']}, retrying {counts['retry']}, "
+                            f"failed {counts['failed']}"
+                        )
+                    delay = queue.next_due()
+                    if not wait or delay is None:
+                        break
+                    # poll, so steps queued meanwhile do not wait for a backoff
+                    time.sleep(min(max(delay, 1), POLL))
+            # a step queued while this worker was stopping found the lock held
+            if not wait or queue.next_due() is None:
+                break
+
+
+@outbox.command("retry")
+def outbox_retry() -> None:
+    """Queue steps that ran out of attempts again."""
+    from utils.outbox import Outbox
+
+    with Outbox() as queue:
+        retried = queue.retry()
+    print(f"\tQueued {retried} failed steps again.")
+    if retried:
+        start_outbox_worker()
+
+
+@mops.command()
+def projects(
+    refresh: bool = typer.Option(
+        False, "--refresh", "-f", help="Refetch project keys from Jira."
+    ),
+) -> None:
+    """Print cached Jira project keys used for ticket validation."""
+    from utils.schema import JIRA_PROJECTS
+
+    keys = JIRA_PROJECTS.refresh() if refresh else JIRA_PROJECTS.get()
+    print("\n".join(sorted(keys)))
+
+
+@mops.command("fake-api")
+def fake_api(
+    port: int = typer.Option(8642, "--port", help="Port to listen on."),
+    latency: float = typer.Option(
+        0.0, "--latency", help="Seconds added to every request."
+    ),
+    jitter: float = typer.Option(
+        0.0, "--jitter", help="Up to this many seconds more or less than --latency."
+    ),
+    error_rate: float = typer.Option(
+        0.0, "--error-rate", min=0.0, max=1.0, help="Fraction of requests that get 500."
+    ),
+    throttle: float = typer.Option(
+        0.0, "--throttle", help="Requests per second before 429, 0 for no limit."
+    ),
+    projects: str = typer.Option(
+        "COR,NOC", "--projects", help="Comma separated Jira project keys."
+    ),
+    missing: str = typer.Option(
+        "", "--missing", help="Comma separated ticket keys that do not exist."
+    ),
+) -> None:
+    """Run a local stand-in for Jira, Confluence and Google Calendar.
+
+    Set MOPS_FAKE_API to the printed URL and mops sends every Jira,
+    Confluence and Calendar request to it instead, without keyring or Google
+    credentials.
+    """
+    from utils.fake_api import FAKE_API_ENV, FakeAPI, base_url, start
+
+    api = FakeAPI(
+        latency,
+        jitter,
+        error_rate,
+        throttle,
+        projects.split(","),
+        filter(None, missing.split(",")),
+    )
+    server = start(api, port=port)
+    print(f"export {FAKE_API_ENV}={base_url(server)}")
+    print("Ctrl-C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(dict(api.stats), indent=2))
+
+
+def run_in_daemon(argv: list, cwd: str) -> tuple:
+    """Run a mops command line for a daemon client.
+
+    Returns (exit code, captured stdout and stderr).
+    """
+    import click
+
+    output = io.StringIO()
+    os.chdir(cwd)
+    with redirect_stdout(output), redirect_stderr(output):
+        try:
+            code = mops(args=argv, prog_name="mops", standalone_mode=False)
+        except SystemExit as e:
+            code = e.code
+        except click.exceptions.Exit as e:
+            code = e.exit_code
+        except click.ClickException as e:
+            e.show()
+            code = e.exit_code
+        except Exception as e:
+            print(f"{type(e).__name__}: {e}")
+            code = 1
+    if not isinstance(code, int):
+        # sys.exit() with a message
+        if code is not None:
+            output.write(f"{code}\n")
+        code = 0 if code is None else 1
+    return code, output.getvalue()
+
+
+@mops.command()
+def serve() -> None:
+    """Run a daemon that keeps clients and templates warm.
+
+    While it runs, the mop, cd and batch commands are handed to it over a
+    Unix socket and skip keyring, client and template setup. Without it they
+    run in-process as usual.
+    """
+    global IN_DAEMON
+    from utils.daemon import SOCKET_PATH
+    from utils.daemon import serve as serve_socket
+
+    IN_DAEMON = True
+    for template in ("mop.j2", "cd.j2"):
+        environment("renderers").get_template(template)
+    try:
+        from utils.schema import JIRA_PROJECTS
+
+        JIRA_PROJECTS.get()
+        get_atlassian()
+        if os.path.exists("cd.yaml") and yaml_init("cd").get("gcal_auth_path"):
+            from utils.gcal import GCal
+
+            GCal(yaml_init("cd")["gcal_auth_path"])
+    except Exception as e:
+        print(f"\tUnable to warm clients ({e}), they will load on first use.")
+
+    print(f"Listening on {SOCKET_PATH}, Ctrl-C to stop.")
+    try:
+        serve_socket(run_in_daemon)
+    except KeyboardInterrupt:
+        pass
 
 
 @mops.callback()
 def arguments(
+    ctx: typer.Context,
     link: bool = typer.Option(
         False,
         "--link",
         "-l",
-        help="Link to supplied Jira ticket. Only use once, will create multiple links.",
+        help="Link to supplied Jira ticket. Safe to repeat, a page's existing "
+        "link is updated rather than added again.",
     ),
     render: bool = typer.Option(
         False, "--render", "-r", help="Print Jinja2 rendered output only."
@@ -184,10 +1501,67 @@ def arguments(
         "-R",
         help="Reset YAML to default settings, no other actions taken.",
     ),
+    force: bool = typer.Option(
+        False,
+        "--force",
+        "-F",
+        help="Push to Confluence even if the rendered page is unchanged.",
+    ),
+    split: bool = typer.Option(
+        False,
+        "--split",
+        "-s",
+        help="Publish each MOP section as a child page of the MOP page. "
+        "Unchanged sections are not pushed.",
+    ),
+    queue: bool = typer.Option(
+        False,
+        "--queue",
+        "-q",
+        help="Queue Confluence, Jira, Calendar and archive steps and return "
+        "immediately, a background worker retries them until they succeed.",
+    ),
+    check_tickets: bool = typer.Option(
+        False,
+        "--check-tickets",
+        "-t",
+        help="Fail validation if a ticket does not exist in Jira. All tickets "
+        "are checked in one search and found tickets are cached for an hour.",
+    ),
+    profile: bool = typer.Option(
+        False,
+        "--profile",
+        "-p",
+        help="Print time per phase and HTTP calls per host when finished.",
+    ),
+    profile_json: Optional[str] = typer.Option(
+        None,
+        "--profile-json",
+        help="Also append the profile as a JSON line to this file.",
+    ),
 ):
     ARGUMENTS.update(
-        {"link": link, "render": render, "default": default, "reset": reset}
+        {
+            "link": link,
+            "render": render,
+            "default": default,
+            "reset": reset,
+            "force": force,
+            "queue": queue,
+            "split": split,
+            "check_tickets": check_tickets,
+        }
     )
+    if profile or profile_json:
+        PROFILER.enable()
+        atexit.register(PROFILER.report, profile_json)
+    elif ctx.invoked_subcommand in DAEMON_COMMANDS and not IN_DAEMON:
+        from utils.daemon import request
+
+        response = request(sys.argv[1:], os.getcwd())
+        if response is not None:
+            print(response["output"], end="")
+            raise typer.Exit(response["code"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,289 @@
+"""Benchmark loading, validating, rendering and publishing synthetic MOPs.
+
+Run from mops/, Atlassian is stubbed so no network access is needed:
+
+  python tests/benchmark.py                  # 1 to 10k steps
+  python tests/benchmark.py --check          # exit 1 on regression vs baseline
+  python tests/benchmark.py --save           # store results as the baseline
+
+Timings depend on the machine, so re-save the baseline when moving to a new
+one rather than comparing across machines.
+"""
+
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import List, Optional
+
+# keep the user's template, Jira project and archive index caches untouched,
+# under pytest tests/conftest.py has already set it
+os.environ.setdefault("MOPS_CACHE_DIR", tempfile.mkdtemp(prefix="mops-benchmark-"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import typer  # noqa: E402
+import yaml  # noqa: E402
+
+import main  # noqa: E402
+from utils.cache import YAMLLoader  # noqa: E402
+
+BASELINE = Path(__file__).resolve().parent / "benchmark_baseline.json"
+SIZES = [1, 10, 100, 1000, 10000]
+STEP_TYPES = (
+    "rh",
+    "cmd_rh",
+    "noc",
+    "cmd_noc",
+    "expand_noc",
+    "core",
+    "cmd_core",
+    "expand_core",
+    "note",
+    "jumper",
+)
+
+
+class StubAtlassian:
+    """Accepts Confluence pushes and Jira links without making them."""
+
+    def confluence_create_or_update(self, page_data, force=False):
+        return True
+
+    def confluence_page_id(self, parent_page_id, page_title):
+        return None
+
+    def jira_reconcile_links(self, links, workers=4):
+        return {"created": 0, "updated": 0, "unchanged": len(links)}
+
+
+def synthetic_jumper(step: int, index: int) -> dict:
+    jumper = {}
+    for side in "az":
+        jumper.update(
+            {
+                f"{side}cage": f"C{step % 7}",
+                f"{side}rack": f"R{step % 31}",
+                f"{side}device": f"dev-{side}-{step}",
+                f"{side}port": f"te0/0/{index}",
+                f"{side}cable": "SMF LC-LC",
+                f"{side}label": f"J{step}-{index}",
+                f"{side}term": "Yes",
+            }
+        )
+    return jumper
+
+
+def synthetic_mop(
+    steps: int,
+    section_size: int = 20,
+    multiline: int = 10,
+    jumpers: int = 2,
+    repository: str = "/tmp/",
+) -> dict:
+    """Return a valid MOP with steps steps.
+
+    args:
+      steps: total steps, cycling through every step type
+      section_size: steps per section
+      multiline: lines in each cmd_/expand_ command block
+      jumpers: jumpers per jumper step
+      repository: existing directory, checked by validation
+    """
+    sections: dict = {}
+    for step in range(steps):
+        name = f"SECTION {step // section_size + 1}"
+        step_type = STEP_TYPES[step % len(STEP_TYPES)]
+        if step_type == "jumper":
+            value = [f"Run jumpers for step {step}"] + [
+                synthetic_jumper(step, index) for index in range(jumpers)
+            ]
+        elif step_type.startswith(("cmd_noc", "cmd_core", "expand_")):
+            value = [
+                f"Apply config for step {step}",
+                "\n".join(
+                    f"interface te0/0/{line} description step-{step}"
+                    for line in range(multiline)
+                ),
+            ]
+        else:
+            value = f"Step {step}: {step_type} instructions"
+        sections.setdefault(name, []).append({step_type: value})
+
+    return {
+        "repository": repository,
+        "page_title": f"BENCHMARK {steps}",
+        "parent_page_id": 1,
+        "ticket": "NOC-100000",
+        "summary": [f"Synthetic MOP with {steps} steps"],
+        "level": 1,
+        "executing_dep": "NOC",
+        "rh": "SACR2",
+        "approval": "COR-100000",
+        "impact": ["None"],
+        "partial_rollback": True,
+        "rollback_steps": [None],
+        "pre_maint": [None],
+        "cleanups": [None],
+        "migration_table": [None],
+        "tech_equip": [None],
+        "shipping": {"NOC-100001": ["7754 7528 9544"]},
+        "sections": sections,
+    }
+
+
+def percentile(ordered: list, p: float) -> float:
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+
+def measure(fn, budget: float = 1.0, min_runs: int = 3, max_runs: int = 100) -> dict:
+    """Time fn until budget seconds or max_runs, then trace one run's memory.
+
+    Returns runs, p50/p95/max in ms and traced peak memory in KiB.
+    """
+    fn()  # warm template, YAML and validation caches
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < min_runs or (
+        len(latencies) < max_runs and time.perf_counter() - start < budget
+    ):
+        run_start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - run_start)
+
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    ordered = sorted(latencies)
+    return {
+        "runs": len(ordered),
+        "p50_ms": round(percentile(ordered, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run(sizes: List[int] = SIZES, budget: float = 1.0, **generator_kwargs) -> dict:
+    """Return {steps: {phase: measurement}} for each document size.
+
+    generator_kwargs are passed to synthetic_mop.
+    """
+    from utils.schema import JIRA_PROJECTS, MOPModel
+
+    # validate tickets against fixed projects rather than Jira
+    JIRA_PROJECTS.seed(["COR", "NOC"])
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="mops-benchmark-") as tmp:
+        repository = Path(tmp) / "repo"
+        repository.mkdir()
+        for steps in sizes:
+            data = synthetic_mop(steps, repository=f"{repository}/", **generator_kwargs)
+            text = yaml.safe_dump(data)
+            path = Path(tmp) / f"mop_{steps}.yaml"
+            path.write_text(text)
+            atlassian = StubAtlassian()
+
+            phases = {
+                "load": lambda: yaml.load(text, Loader=YAMLLoader),
+                "validate": lambda: MOPModel(**data),
+                "render": lambda: main.render_yaml(data, "mop"),
+                "publish": lambda: main.batch_file(
+                    str(path), atlassian, link=True, render=False
+                ),
+            }
+            results[steps] = {}
+            for phase, fn in phases.items():
+                # batch_file prints the archived title
+                with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                    result = measure(fn, budget)
+                result["steps_per_s"] = round(steps / (result["p50_ms"] / 1000), 1)
+                results[steps][phase] = result
+    return results
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return descriptions of phases whose p50 exceeds baseline * tolerance."""
+    slower = []
+    for steps, phases in results.items():
+        for phase, result in phases.items():
+            base = baseline["results"].get(str(steps), {}).get(phase)
+            if base and result["p50_ms"] > base["p50_ms"] * tolerance:
+                slower.append(
+                    f"{steps} steps {phase}: {result['p50_ms']:.2f} ms, "
+                    f"baseline {base['p50_ms']:.2f} ms"
+                )
+    return slower
+
+
+def report(results: dict) -> None:
+    print(
+        f"{'Steps':>7}  {'Phase':<10}{'Runs':>6}{'p50 ms':>11}{'p95 ms':>11}"
+        f"{'steps/s':>13}{'Peak KiB':>11}"
+    )
+    for steps, phases in results.items():
+        for phase, r in phases.items():
+            print(
+                f"{steps:>7}  {phase:<10}{r['runs']:>6}{r['p50_ms']:>11.2f}"
+                f"{r['p95_ms']:>11.2f}{r['steps_per_s']:>13.0f}"
+                f"{r['peak_kib']:>11.0f}"
+            )
+
+
+def cli(
+    sizes: Optional[List[int]] = typer.Option(
+        None, "--size", "-s", help="Steps per document, repeatable. 1 to 10k."
+    ),
+    section_size: int = typer.Option(20, help="Steps per section."),
+    multiline: int = typer.Option(10, help="Lines per command block."),
+    jumpers: int = typer.Option(2, help="Jumpers per jumper step."),
+    budget: float = typer.Option(1.0, help="Seconds to spend per phase and size."),
+    save: bool = typer.Option(False, "--save", help="Store results as baseline."),
+    check: bool = typer.Option(
+        False, "--check", help="Exit 1 if a phase is slower than the baseline."
+    ),
+    tolerance: float = typer.Option(
+        1.5, help="Allowed p50 slowdown vs baseline for --check."
+    ),
+) -> None:
+    """Benchmark MOP load, validate, render and publish."""
+    results = run(
+        sizes or SIZES,
+        budget,
+        section_size=section_size,
+        multiline=multiline,
+        jumpers=jumpers,
+    )
+    report(results)
+
+    if save:
+        BASELINE.write_text(
+            json.dumps(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "results": results,
+                },
+                indent=2,
+            )
+            + "\n"
+        )
+        print(f"\nBaseline saved to {BASELINE}")
+    if check:
+        slower = regressions(results, json.loads(BASELINE.read_text()), tolerance)
+        if slower:
+            sys.exit("\nSlower than baseline:\n\t" + "\n\t".join(slower))
+        print(f"\nWithin {tolerance}x of baseline.")
+
+
+if __name__ == "__main__":
+    typer.run(cli)
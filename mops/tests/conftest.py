@@ -0,0 +1,13 @@
+import os
+import shutil
+import tempfile
+
+# Modules copy CACHE_DIR when first imported, so this must run before the test
+# modules import mops. Keeps the archive index, YAML pickles, render log and
+# other caches out of the user's ~/.cache/mops.
+CACHE_DIR = tempfile.mkdtemp(prefix="mops-test-cache-")
+os.environ["MOPS_CACHE_DIR"] = CACHE_DIR
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
@@ -1,5 +1,36 @@
+import gzip
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
 import pytest
+import yaml
 from mops import main
+from mops.utils import templates
+from mops.utils.archive import ArchiveStore
+from mops.utils.atlassian import Atlassian
+from mops.utils.cache import PageLedger, ProjectsCache, TicketsCache, YAMLCache
+from mops.utils.timing import Profiler
+
+MOPS_DIR = os.path.dirname(main.__file__)
+# --render and --reset budget, measured from 'import main' to exit
+STARTUP_BUDGET = 0.2
+HEAVY_MODULES = ["atlassian", "googleapiclient", "google_auth_oauthlib", "keyring"]
+
+
+@pytest.fixture(autouse=True)
+def jira_projects(tmp_path, monkeypatch):
+    """Serve ticket validation from a warm on-disk project cache."""
+    from utils.schema import JIRA_PROJECTS
+
+    path = tmp_path / "jira_projects.json"
+    path.write_text(json.dumps({"fetched": time.time(), "projects": ["COR", "NOC"]}))
+    monkeypatch.setattr(JIRA_PROJECTS, "path", path)
+    JIRA_PROJECTS.seed(None)
+    return path
 
 
 @pytest.fixture
@@ -122,3 +153,892 @@ def test_mop_schema(mop_dict):
 
 def test_cd_schema(cd_dict):
     main.validate_yaml(cd_dict, "cd")
+
+
+def test_projects_cache_fresh(jira_projects):
+    def fetch():
+        raise AssertionError("fresh cache must not call Jira")
+
+    cache = ProjectsCache(fetch, path=jira_projects)
+    assert cache.get() == {"COR", "NOC"}
+
+
+def test_projects_cache_stale_refresh(jira_projects):
+    cache = ProjectsCache(lambda: ["NOC", "SYS"], path=jira_projects, ttl=0)
+    assert cache.get() == {"NOC", "SYS"}
+    assert json.loads(jira_projects.read_text())["projects"] == ["NOC", "SYS"]
+
+
+def test_projects_cache_offline_fallback(jira_projects):
+    def fetch():
+        raise ConnectionError
+
+    cache = ProjectsCache(fetch, path=jira_projects, ttl=0)
+    assert cache.get() == {"COR", "NOC"}
+    with pytest.raises(ConnectionError):
+        ProjectsCache(fetch, path=jira_projects.with_name("missing.json")).get()
+
+
+def test_tickets_cache(mop_dict, tmp_path, monkeypatch):
+    from utils.schema import JIRA_TICKETS
+
+    searches = []
+
+    def fetch(keys):
+        searches.append(keys)
+        return {key for key in keys if key != "NOC-404"}
+
+    cache = TicketsCache(fetch, path=tmp_path / "tickets.json")
+    monkeypatch.setattr(JIRA_TICKETS, "path", cache.path)
+    monkeypatch.setattr(JIRA_TICKETS, "fetch", fetch)
+    second = dict(mop_dict, ticket="NOC-2", shipping={"NOC-3": ["1Z"]})
+    # malformed keys are left to schema validation, not sent to Jira
+    malformed = dict(mop_dict, ticket="noc 5", approval="NOC-6)")
+    main.check_tickets([mop_dict, second, malformed])
+    # every ticket of both documents in one search, then served from disk
+    assert searches == [
+        ["COR-1696", "NOC-2", "NOC-3", "NOC-663883", "NOC-663884", "NOC-664802"]
+    ]
+    assert cache.missing(["NOC-2", "NOC-664802"]) == set()
+    assert cache.missing(["NOC-2", "NOC-404"]) == {"NOC-404"}
+    assert searches[-1] == ["NOC-404"]
+    with pytest.raises(SystemExit, match="NOC-404"):
+        main.check_tickets([dict(mop_dict, approval="NOC-404")])
+
+
+class StubAtlassian:
+    """Records Confluence and Jira calls instead of making them."""
+
+    def __init__(self):
+        self.pages = []
+        self.links = []
+
+    def confluence_create_or_update(self, page_data, force=False):
+        self.pages.append(page_data)
+        return True
+
+    def confluence_page_id(self, parent_page_id, page_title):
+        for parent, title, _ in self.pages:
+            if (parent, title) == (parent_page_id, page_title):
+                return f"{parent}-{title}"
+        return None
+
+    def jira_reconcile_links(self, links, workers=4):
+        self.links.extend(links)
+        return {"created": len(links), "updated": 0, "unchanged": 0}
+
+
+def test_batch_publish(mop_dict, tmp_path, monkeypatch):
+    repository = tmp_path / "repo"
+    repository.mkdir()
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    mop_dict["repository"] = f"{repository}/"
+    # template-only keys present in every mop.yaml generated from defaults
+    mop_dict.update(cleanups=[None], migration_table=[None], tech_equip=[None])
+    for title in ("ONE", "TWO"):
+        mop_dict["page_title"] = title
+        (docs / f"{title}.yaml").write_text(yaml.safe_dump(mop_dict))
+    mop_dict["ticket"] = "BAD-1"
+    (docs / "BAD.yaml").write_text(yaml.safe_dump(mop_dict))
+
+    atlassian = StubAtlassian()
+    paths = sorted(str(p) for p in docs.iterdir())
+    results = main.batch_publish(paths, atlassian, workers=2, link=True)
+
+    assert [ok for ok, _ in results.values()] == [False, True, True]
+    assert sorted(page[1] for page in atlassian.pages) == ["ONE", "TWO"]
+    assert len(atlassian.links) == 2
+    assert len(ArchiveStore(f"{repository}/").entries("mop")) == 2
+
+
+def test_template_environment_shared(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    env = templates.environment("renderers")
+    assert env is templates.environment("renderers")
+    assert env.get_template("cd.j2") is env.get_template("cd.j2")
+    assert env.bytecode_cache is not None
+
+
+class StubConfluence:
+    """Counts Confluence page writes."""
+
+    def __init__(self):
+        self.calls = []
+
+    def update_or_create(self, parent_id, title, body, representation):
+        self.calls.append("update_or_create")
+        return {"id": "100", "version": {"number": 1}}
+
+    def update_page(self, page_id, title, body, **kwargs):
+        self.calls.append(f"update_page {page_id}")
+        return {"id": page_id, "version": {"number": 2}}
+
+
+def test_confluence_ledger_skips_unchanged(tmp_path):
+    atlassian = Atlassian.__new__(Atlassian)
+    atlassian.confluence = StubConfluence()
+    atlassian.ledger = PageLedger(tmp_path / "ledger.json")
+
+    assert atlassian.confluence_create_or_update([1, "TEST", "body"])
+    assert not atlassian.confluence_create_or_update([1, "TEST", "body"])
+    assert atlassian.confluence_create_or_update([1, "TEST", "new body"])
+    assert atlassian.confluence_create_or_update([1, "TEST", "new body"], force=True)
+    assert atlassian.confluence.calls == [
+        "update_or_create",
+        "update_page 100",
+        "update_page 100",
+    ]
+    entry = PageLedger(tmp_path / "ledger.json").get(1, "TEST")
+    assert entry["version"] == 2
+
+    # the daemon and outbox worker share the ledger: neither loses the
+    # other's pushes nor skips one because of a stale copy
+    daemon = PageLedger(tmp_path / "shared.json")
+    worker = PageLedger(tmp_path / "shared.json")
+    daemon.record(1, "A", 100, 1, "a")
+    worker.record(1, "A", 100, 2, "b")
+    daemon.record(1, "B", 101, 1, "c")
+    assert daemon.get(1, "A")["hash"] == "b"
+    assert worker.get(1, "B")["hash"] == "c"
+    assert PageLedger(tmp_path / "shared.json").get(1, "A")["version"] == 2
+
+
+def test_profiler_phases(tmp_path):
+    profiler = Profiler()
+    with profiler.phase("render"):
+        pass
+    with profiler.phase("render"):
+        pass
+    profiler.count_http("https://jira.example.org/rest/api/2/project")
+    profiler.report(str(tmp_path / "profile.jsonl"))
+
+    summary = json.loads((tmp_path / "profile.jsonl").read_text())
+    assert summary["phases"]["render"]["calls"] == 2
+    assert summary["http"] == {"jira.example.org": 1}
+
+
+@pytest.mark.parametrize("option", ["--render", "--reset"])
+def test_startup_budget(option, mop_dict, tmp_path, jira_projects):
+    mop_dict.update(
+        repository=f"{tmp_path}/",
+        cleanups=[None],
+        migration_table=[None],
+        tech_equip=[None],
+    )
+    (tmp_path / "mop.yaml").write_text(yaml.safe_dump(mop_dict))
+    script = f"""
+import json, sys, time
+sys.path.insert(0, {MOPS_DIR!r})
+start = time.perf_counter()
+import main
+main.mops([{option!r}, "mop"], standalone_mode=False)
+elapsed = time.perf_counter() - start
+heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]
+print(json.dumps({{"elapsed": elapsed, "heavy": heavy}}), file=sys.stderr)
+"""
+    # fresh interpreters sharing a cache dir holding only the Jira project
+    # keys, so the first run is cold: no YAML pickle, validity memo or
+    # template bytecode, and pydantic is imported to validate
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    (cache_dir / "jira_projects.json").write_bytes(jira_projects.read_bytes())
+    env = dict(os.environ, MOPS_CACHE_DIR=str(cache_dir))
+    runs = []
+    for run in range(2):
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=tmp_path,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        runs.append(json.loads(result.stderr.strip().splitlines()[-1]))
+    assert all(stats["heavy"] == [] for stats in runs)
+    assert runs[0]["elapsed"] < STARTUP_BUDGET, runs
+    # the second run reuses the caches the first one wrote
+    assert runs[1]["elapsed"] < STARTUP_BUDGET, runs
+
+
+def test_publish_steps_concurrent():
+    def slow():
+        time.sleep(0.2)
+        return True
+
+    def fail():
+        time.sleep(0.2)
+        raise ConnectionError("jira down")
+
+    start = time.perf_counter()
+    results = main.publish_steps({"Confluence": slow, "Jira link": fail, "Cal": slow})
+    assert time.perf_counter() - start < 0.4
+    assert results["Confluence"] == (True, True)
+    assert not results["Jira link"][0]
+    assert isinstance(results["Jira link"][1], ConnectionError)
+
+
+def test_gcal_single_static_build(tmp_path, monkeypatch):
+    from utils import gcal
+
+    builds = []
+    (tmp_path / "gcal_token.json").write_text("{}")
+    creds = type("Creds", (), {"valid": True})()
+    monkeypatch.setattr(
+        gcal.Credentials, "from_authorized_user_file", lambda *args: creds
+    )
+    monkeypatch.setattr(
+        gcal, "build", lambda *args, **kwargs: builds.append(kwargs) or object()
+    )
+    monkeypatch.setattr(gcal, "internal_calendar_url", lambda: "internal")
+    monkeypatch.setattr(gcal, "_SERVICES", {})
+
+    first = gcal.GCal(str(tmp_path))
+    second = gcal.GCal(str(tmp_path))
+    assert first.service is second.service
+    assert builds == [{"credentials": creds, "static_discovery": True}]
+
+
+class FakeCalendarService:
+    """Minimal Calendar API: one existing event, batches recorded."""
+
+    def __init__(self, existing):
+        self.existing = existing
+        self.batches = []
+
+    def events(self):
+        return self
+
+    def list(self, **kwargs):
+        return type("Request", (), {"execute": lambda _: {"items": self.existing}})()
+
+    def list_next(self, request, response):
+        return None
+
+    def insert(self, calendarId, body):
+        return body
+
+    def new_batch_http_request(self, callback):
+        service = self
+
+        class Batch:
+            def __init__(self):
+                self.requests = []
+
+            def add(self, request, request_id):
+                self.requests.append((request_id, request))
+
+            def execute(self):
+                service.batches.append([body["summary"] for _, body in self.requests])
+                for request_id, body in self.requests:
+                    error = ValueError("quota") if body["summary"] == "BAD" else None
+                    callback(request_id, body, error)
+
+        return Batch()
+
+
+def test_gcal_bulk_events(monkeypatch):
+    from utils import gcal
+
+    existing = [{"summary": "OLD", "start": {"dateTime": "2026-10-19T17:40:00-07:00"}}]
+    calendar = gcal.GCal.__new__(gcal.GCal)
+    calendar.service = FakeCalendarService(existing)
+    calendar.internal_cal_url = "internal"
+    calendar._day_index = {}
+    monkeypatch.setattr(gcal, "BATCH_LIMIT", 2)
+
+    events = [
+        ("1740", "1900", "2026-10-19", "OLD"),
+        ("1740", "1900", "2026-10-19", "NEW"),
+        ("1740", "1900", "2026-10-19", "NEW"),
+        ("0100", "0200", "2026-10-20", "NEXT"),
+        ("0100", "0200", "2026-10-20", "BAD"),
+    ]
+    results = calendar.create_calendar_events(events)
+    assert results == ["exists", "created", "exists", "created", "failed: quota"]
+    assert calendar.service.batches == [["NEW", "NEXT"], ["BAD"]]
+    assert ("BAD", "2026-10-20T01:00:00") not in calendar._day_index[
+        gcal.date(2026, 10, 20)
+    ]
+
+
+def test_yaml_cache(mop_dict, tmp_path, monkeypatch):
+    path = tmp_path / "mop.yaml"
+    path.write_text(yaml.safe_dump(mop_dict))
+    cache = YAMLCache(tmp_path / "cache")
+    assert cache.load(str(path)) == mop_dict
+    assert not cache.is_valid(str(path), "mop", "fp")
+    cache.mark_valid(str(path), "mop", "fp")
+
+    # a new session reuses the pickled parse and validation result
+    def no_parse(*args, **kwargs):
+        raise AssertionError("unchanged file must not be re-parsed")
+
+    monkeypatch.setattr(yaml, "load", no_parse)
+    warm = YAMLCache(tmp_path / "cache")
+    assert warm.load(str(path)) == mop_dict
+    assert warm.is_valid(str(path), "mop", "fp")
+    # a schema, project list or directory change gives another fingerprint
+    assert not warm.is_valid(str(path), "mop", "other")
+    monkeypatch.undo()
+
+    mop_dict["page_title"] = "CHANGED"
+    path.write_text(yaml.safe_dump(mop_dict))
+    assert warm.load(str(path))["page_title"] == "CHANGED"
+    assert not warm.is_valid(str(path), "mop", "fp")
+
+
+def test_validation_fingerprint(mop_dict, tmp_path):
+    from utils.cache import JIRA_PROJECTS, validation_fingerprint
+
+    mop_dict["repository"] = str(tmp_path / "repo")
+    before = validation_fingerprint(mop_dict)
+    assert validation_fingerprint(mop_dict) == before
+    (tmp_path / "repo").mkdir()
+    after = validation_fingerprint(mop_dict)
+    assert after != before
+    JIRA_PROJECTS.seed(["COR"])
+    assert validation_fingerprint(mop_dict) != after
+
+
+def test_incremental_render(mop_dict):
+    from utils.render import IncrementalRenderer
+
+    mop_dict.update(cleanups=[None], migration_table=[None], tech_equip=[None])
+    mop_dict["sections"]["TEST SECTION3"] = [{"note": "TEST"}]
+    renderer = IncrementalRenderer()
+    assert renderer.render(mop_dict) == main.render_yaml(mop_dict, "mop")
+    assert renderer.rendered == 3
+
+    # an extra jumper in section 1 renumbers section 2 but not section 3
+    mop_dict["sections"]["TEST SECTION1"][-1]["jumper"].append({"acable": "NEW"})
+    assert renderer.render(mop_dict) == main.render_yaml(mop_dict, "mop")
+    assert (renderer.rendered, renderer.reused) == (2, 1)
+
+    mop_dict["sections"]["TEST SECTION3"].append({"note": "NEW"})
+    assert renderer.render(mop_dict) == main.render_yaml(mop_dict, "mop")
+    assert (renderer.rendered, renderer.reused) == (1, 2)
+
+    mop_dict["ticket"] = "NOC-1"
+    assert renderer.render(mop_dict) == main.render_yaml(mop_dict, "mop")
+    assert (renderer.rendered, renderer.reused) == (0, 3)
+
+
+def test_jumper_source(mop_dict, tmp_path, monkeypatch):
+    from pydantic import ValidationError
+    from utils.index import document_refs
+    from utils import jumpers
+    from utils.jumpers import inline_sources, load_table, resolve_sources
+    from utils.render import IncrementalRenderer
+    from utils.report import count_jumpers
+    from utils.schema import MOPModel
+
+    mop_dict.update(cleanups=[None], migration_table=[None], tech_equip=[None])
+    # a CSV of the same jumper renders exactly as the inline jumper step
+    jumper_step = mop_dict["sections"]["TEST SECTION1"][-1]
+    jumper = jumper_step["jumper"][1]
+    path = tmp_path / "jumpers.csv"
+    path.write_text(",".join(jumper) + "\n" + ",".join(jumper.values()) + "\n")
+    expected = main.render_yaml(mop_dict, "mop")
+    jumper_step.pop("jumper")
+    jumper_step["jumper_source"] = ["Instructions", str(path)]
+    MOPModel(**mop_dict)
+    renderer = IncrementalRenderer()
+    assert renderer.render(mop_dict) == main.render_yaml(mop_dict, "mop") == expected
+
+    # editing the CSV re-renders its section and renumbers the next
+    with path.open("a") as f:
+        f.write(",".join(jumper.values()) + "\n")
+    assert "Jumper #3" in renderer.render(mop_dict)
+    assert renderer.reused == 0
+
+    netbox = tmp_path / "netbox.csv"
+    netbox.write_text(
+        "ID,Label,Side A,Termination A,Side B,Termination B,Type,Status\n"
+        "1,J1,rtr1,et-0/0/1,rtr2,et-0/0/2,smf,Connected\n"
+        "2,J2,rtr1,et-0/0/3,rtr2,et-0/0/4,smf,Connected\n"
+    )
+    table = load_table(str(netbox))
+    assert table.columns["aport"] == ["et-0/0/1", "et-0/0/3"]
+    assert table.columns["zlabel"] == ["J1", "J2"]
+    # repeated values are stored once
+    assert table.columns["adevice"][0] is table.columns["adevice"][1]
+
+    path.write_text("acage,aterm\nC1,maybe\n")
+    with pytest.raises(ValidationError, match="aterm must be Yes, No or empty"):
+        MOPModel(**mop_dict)
+
+    # relative paths are read from the YAML's directory, not the cwd, and the
+    # archive keeps the CSV so the MOP still renders and indexes without it
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "jumpers.csv").write_text(
+        ",".join(jumper) + "\n" + ",".join(jumper.values()) + "\n"
+    )
+    jumper_step["jumper_source"] = ["Instructions", "jumpers.csv"]
+    (docs / "mop.yaml").write_text(yaml.safe_dump(mop_dict))
+    monkeypatch.chdir(tmp_path)
+    data = main.yaml_init(path=str(docs / "mop.yaml"))
+    assert main.render_yaml(data, "mop") == expected
+    main.move_yaml("TEST", f"{tmp_path}/", "mop", source=str(docs / "mop.yaml"))
+    (docs / "jumpers.csv").unlink()
+    store = ArchiveStore(f"{tmp_path}/")
+    archived = yaml.safe_load(store.read(store.find("TEST")))
+    assert archived["jumper_tables"]["jumpers.csv"].startswith("acable,")
+    assert main.render_yaml(resolve_sources(archived), "mop") == expected
+    assert ("device", "test") in document_refs(archived)
+    # one jumper from the CSV, one listed in TEST SECTION2
+    assert count_jumpers(archived) == 2
+    # YAML without jumper_source steps is archived as is, without parsing
+    assert inline_sources(b"{not: [yaml", str(docs)) == b"{not: [yaml"
+
+    # the daemon keeps only the most recently used tables
+    monkeypatch.setattr(jumpers, "MAX_TABLES", 2)
+    for name in ("a", "b", "c"):
+        (tmp_path / f"{name}.csv").write_text("acage\nC1\n")
+        load_table(str(tmp_path / f"{name}.csv"))
+    assert list(jumpers._TABLES) == [str(tmp_path / "b.csv"), str(tmp_path / "c.csv")]
+
+
+def test_archive_store(mop_dict, tmp_path):
+    source = tmp_path / "mop.yaml"
+    source.write_text(yaml.safe_dump(mop_dict))
+    store = ArchiveStore(f"{tmp_path}/")
+    first = store.put(str(source), "mop", "2026-10-01", "TEST")
+    # republishing the same content under a new date shares one blob
+    second = store.put(str(source), "mop", "2026-10-02", "TEST")
+    store.put(str(source), "mop", "2026-10-02", "TEST")
+    assert first["blob"] == second["blob"]
+    assert len(list((tmp_path / "store" / "blobs").rglob("*.gz"))) == 1
+    assert len(store.manifest_path.read_text().splitlines()) == 2
+
+    assert store.find("TEST") == second
+    store.restore(store.find("TEST", "2026-10-01"), str(tmp_path / "restored.yaml"))
+    assert (tmp_path / "restored.yaml").read_bytes() == source.read_bytes()
+
+    (tmp_path / "cd").mkdir()
+    (tmp_path / "cd" / "2026-09-30_OLD_CD.yaml").write_text("ticket: NOC-1\n")
+    assert store.import_flat() == 1
+    assert store.import_flat() == 0
+    assert [e["title"] for e in ArchiveStore(f"{tmp_path}/").entries()] == [
+        "OLD_CD",
+        "TEST",
+        "TEST",
+    ]
+
+
+def test_archive_index(mop_dict, cd_dict, tmp_path):
+    from utils.index import ArchiveIndex
+
+    store = ArchiveStore(f"{tmp_path}/")
+    for yaml_type, data in (("mop", mop_dict), ("cd", cd_dict)):
+        path = tmp_path / f"{yaml_type}.yaml"
+        path.write_text(yaml.safe_dump(data))
+        store.put(str(path), yaml_type, "2026-10-01", data["page_title"])
+
+    with ArchiveIndex(tmp_path / "index.sqlite3") as index:
+        assert index.update(store) == (2, 0)
+        assert index.update(store) == (0, 0)
+        assert [row[1] for row in index.search("noc-663883")] == ["mop"]
+        assert [row[1] for row in index.search("SUT-COE-*", "device")] == [
+            "cd",
+            "cd",
+        ]
+        assert {row[3] for row in index.search("test")} >= {"device", "rack"}
+
+        cd_dict["changes"] = {"sut-coe-3": ["shutdown"]}
+        (tmp_path / "cd.yaml").write_text(yaml.safe_dump(cd_dict))
+        store.put(str(tmp_path / "cd.yaml"), "cd", "2026-10-01", "TEST")
+        assert index.update(store) == (1, 0)
+        assert index.search("sut-coe-1") == []
+        assert len(index.search("sut-coe-3")) == 1
+        index.conn.execute("INSERT INTO event_days VALUES ('2026-10-01', 0)")
+        index.conn.execute("PRAGMA user_version = 0")
+        index.conn.commit()
+
+    # a schema change rebuilds every table, windows and events included
+    tables = ("documents", "refs", "windows", "events", "event_days")
+    with ArchiveIndex(tmp_path / "index.sqlite3") as index:
+        counts = [
+            index.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in tables
+        ]
+        assert counts == [0, 0, 0, 0, 0]
+
+
+def test_change_conflicts(cd_dict, tmp_path, monkeypatch, capsys):
+    from datetime import date
+
+    from utils.index import ArchiveIndex, change_window
+
+    monkeypatch.setattr("utils.index.CACHE_DIR", tmp_path)
+    store = ArchiveStore(f"{tmp_path}/")
+    archived = [
+        ("OTHER", "0900", "1100", "2026-10-20", "sut-coe-1"),
+        ("LATER", "1300", "1400", "2026-10-20", "sut-coe-1"),
+        ("NIGHT", "2300", "0130", "2026-10-19", "sut-coe-9"),
+        ("TODAY", "1000", "1030", "today", "sut-coe-9"),
+    ]
+    for title, start, end, day, device in archived:
+        data = dict(
+            cd_dict, start_time=start, end_time=end, start_day=day, page_title=title
+        )
+        data["changes"] = {device: ["shutdown"]}
+        content = yaml.safe_dump(data).encode()
+        store.put_content(content, "cd", "2026-10-20", title)
+
+    cd_dict.update(
+        repository=f"{tmp_path}/",
+        start_day="2026-10-20",
+        start_time="0100",
+        end_time="1030",
+    )
+    main.warn_conflicts(cd_dict)
+    out = capsys.readouterr().out
+    assert "NIGHT" in out and "TODAY" in out and "LATER" not in out
+    assert "OTHER  CONFLICT [device: sut-coe-1]" in out
+    assert change_window({**cd_dict, "end_time": "0030"})[1] == "2026-10-21T00:30"
+
+    fetches = []
+
+    def fetch(day):
+        fetches.append(day)
+        return [("Other team", "2026-10-20T10:00", "2026-10-20T11:00")]
+
+    with ArchiveIndex() as index:
+        for _ in range(2):
+            events = index.calendar_events(date(2026, 10, 20), fetch)
+    assert events == [("Other team", "2026-10-20T10:00", "2026-10-20T11:00")]
+    assert len(fetches) == 1
+
+
+def test_report(mop_dict, cd_dict, tmp_path):
+    from utils.report import PartialsCache, build_report
+
+    store = ArchiveStore(f"{tmp_path}/")
+    # paths of the machine a document was published from are not checked
+    mop_dict["repository"] = "/Users/elsewhere/MOPs/YAML/"
+    cd_dict.update(repository=f"{tmp_path}/missing/", gcal_auth_path="/nowhere/")
+    mop_dict.update(cleanups=[None], migration_table=[None], tech_equip=[None])
+    for date, title, level in (("2026-09-30", "ONE", 1), ("2026-10-01", "TWO", 2)):
+        data = dict(mop_dict, page_title=title, level=level)
+        store.put_content(yaml.safe_dump(data).encode(), "mop", date, title)
+    store.put_content(yaml.safe_dump(cd_dict).encode(), "cd", "2026-10-02", "CD")
+    store.put_content(b"- not a document", "cd", "2026-10-03", "BROKEN")
+
+    cache = PartialsCache(tmp_path / "partials.json")
+    report, read = build_report([store], workers=2, cache=cache)
+    assert read == 4
+    stats = report.as_dict()
+    assert stats["changes_per_month"] == {"2026-09": 1, "2026-10": 3}
+    assert stats["mops_per_level"] == {"1": 1, "2": 1}
+    assert stats["jumpers_per_site"] == {"SACR2": 4}
+    assert stats["validation"] == {"unreadable": 1, "valid": 3}
+    assert ("cds_per_month", "2026-10", 1) in report.rows()
+
+    # a re-run only reads documents archived since
+    cd_dict["page_title"] = "CD2"
+    store.put_content(yaml.safe_dump(cd_dict).encode(), "cd", "2026-10-04", "CD2")
+    report, read = build_report([store], workers=2, cache=PartialsCache(cache.path))
+    assert (read, report.documents) == (1, 5)
+
+
+def test_rerender(mop_dict, tmp_path, monkeypatch, capsys):
+    from utils.rerender import RenderLog
+
+    monkeypatch.setattr("utils.rerender.CACHE_DIR", tmp_path)
+    atlassian = StubAtlassian()
+    monkeypatch.setattr(main, "get_atlassian", lambda: atlassian)
+    mop_dict.update(cleanups=[None], migration_table=[None], tech_equip=[None])
+    store = ArchiveStore(f"{tmp_path}/")
+    for title in ("ONE", "TWO"):
+        data = dict(mop_dict, page_title=title)
+        store.put_content(yaml.safe_dump(data).encode(), "mop", "2026-10-01", title)
+        main.publish_confluence(
+            atlassian, 45428825, title, main.render_yaml(data, "mop"), yaml_type="mop"
+        )
+
+    def rerender():
+        main.rerender([f"{tmp_path}/"], None, False, False, 2, 2)
+        return capsys.readouterr().out
+
+    assert "0 changed, 0 unchanged, 0 failed, 2 already current" in rerender()
+
+    # after a template change, only pages whose output differs are pushed
+    with RenderLog() as log:
+        log.conn.execute("UPDATE renders SET template = 'old'")
+        log.conn.execute(
+            "UPDATE renders SET body = ? WHERE page LIKE '%/TWO'",
+            (gzip.compress(b"old layout"),),
+        )
+        log.conn.commit()
+    out = rerender()
+    assert "1 changed, 1 unchanged" in out and "CHANGED TWO: +" in out
+    assert [page[1] for page in atlassian.pages] == ["ONE", "TWO", "TWO"]
+    assert "2 already current" in rerender()
+
+
+def test_daemon_request(tmp_path):
+    import threading
+
+    from utils import daemon
+
+    path = tmp_path / "mops.sock"
+    assert daemon.request(["mop"], str(tmp_path), path) is None
+
+    calls = []
+
+    def run(argv, cwd):
+        calls.append((argv, cwd))
+        return 3, "rendered\n"
+
+    server = threading.Thread(target=daemon.serve, args=(run, path), daemon=True)
+    server.start()
+    for _ in range(100):
+        if path.exists():
+            break
+        time.sleep(0.01)
+    response = daemon.request(["--render", "mop"], str(tmp_path), path)
+    assert response == {"code": 3, "output": "rendered\n"}
+    assert calls == [(["--render", "mop"], str(tmp_path))]
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    with pytest.raises(RuntimeError):
+        daemon.serve(run, path)
+
+    # a daemon that dies mid-reply falls back to running in-process
+    truncated = tmp_path / "truncated.sock"
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(truncated))
+    listener.listen(1)
+
+    def reply():
+        conn, _ = listener.accept()
+        with conn:
+            conn.recv(65536)
+            conn.sendall(b'{"code": 0, "out')
+
+    threading.Thread(target=reply, daemon=True).start()
+    assert daemon.request(["mop"], str(tmp_path), truncated) is None
+    listener.close()
+
+
+def test_outbox_retries_in_order(tmp_path, monkeypatch):
+    from utils import outbox
+    from utils.outbox import Outbox, job_key
+
+    calls = []
+
+    def confluence(payload, key):
+        calls.append(("confluence", key))
+        if len(calls) == 1:
+            raise ConnectionError("Confluence unreachable")
+
+    handlers = {
+        "confluence": confluence,
+        "archive": lambda payload, key: calls.append(("archive", key)),
+    }
+    with Outbox(tmp_path / "outbox.sqlite3") as queue:
+        key = job_key("confluence", 1, "TEST", "body")
+        page = queue.enqueue("confluence", {"page_title": "TEST"}, key)
+        # the same side effect is only queued once
+        assert queue.enqueue("confluence", {"page_title": "TEST"}, key) == page
+        queue.enqueue("archive", {}, job_key("archive", "TEST"), after=page)
+
+        # the archive waits for the failed push, which backs off
+        assert queue.flush(handlers) == {"done": 0, "retry": 1, "failed": 0}
+        assert calls == [("confluence", key)]
+        assert 0 < queue.next_due() <= outbox.BASE_BACKOFF
+
+    monkeypatch.setattr(outbox, "BASE_BACKOFF", 0)
+    # jobs survive a restart
+    with Outbox(tmp_path / "outbox.sqlite3") as queue:
+        queue.conn.execute("UPDATE jobs SET next_attempt = 0")
+        assert queue.flush(handlers) == {"done": 2, "retry": 0, "failed": 0}
+        assert [kind for kind, _ in calls] == ["confluence", "confluence", "archive"]
+        assert queue.jobs() == [] and queue.next_due() is None
+
+        # a second worker does not wait for the running one
+        with queue.worker_lock() as locked, Outbox(queue.db_path) as other:
+            with other.worker_lock() as other_locked:
+                assert locked and not other_locked
+
+
+def test_pooled_session_retries(monkeypatch):
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from utils.session import HTTPConfig, PooledSession, TokenBucket
+
+    statuses = {"GET": [429, 503, 200], "POST": [502, 200]}
+    wait = {"Retry-After": "0"}
+
+    class Handler(BaseHTTPRequestHandler):
+        def respond(self):
+            self.send_response(statuses[self.command].pop(0))
+            self.send_header("Retry-After", wait["Retry-After"])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        do_GET = do_POST = respond
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    profiler = Profiler()
+    # as enable(), without patching the requests transport for other tests
+    profiler.enabled = True
+    monkeypatch.setattr("utils.session.PROFILER", profiler)
+
+    session = PooledSession(HTTPConfig(rate=0, backoff=0))
+    assert session.get(url).status_code == 200
+    # gateway errors are not retried for requests that may have been applied
+    assert session.post(url).status_code == 502
+    # once retries are spent the Atlassian clients must not retry on their own
+    statuses["GET"].append(429)
+    throttled = PooledSession(HTTPConfig(rate=0, backoff=0, retries=0)).get(url)
+    assert throttled.status_code == 429 and "Retry-After" not in throttled.headers
+    # a server asking for an hour is only waited on for max_backoff
+    statuses["GET"] += [503, 200]
+    wait["Retry-After"] = "3600"
+    sleeps = []
+    monkeypatch.setattr("utils.session.time.sleep", sleeps.append)
+    capped = PooledSession(HTTPConfig(rate=0, backoff=0, max_backoff=2))
+    assert capped.get(url).status_code == 200 and sleeps == [2]
+    monkeypatch.undo()
+    server.shutdown()
+    assert profiler.retries["127.0.0.1"] == 3
+    assert profiler.summary()["latency"]["127.0.0.1"]["requests"] == 7
+
+    bucket = TokenBucket(rate=100, burst=2)
+    start = time.perf_counter()
+    for _ in range(4):
+        bucket.acquire()
+    assert time.perf_counter() - start >= 0.015
+
+
+def test_benchmark_harness(tmp_path, monkeypatch):
+    from mops.tests import benchmark
+    from utils.rerender import RenderLog
+    from utils.schema import MOPModel
+
+    # benchmark.py sets MOPS_CACHE_DIR too late once mops is imported, so
+    # the publish phase's render log relies on conftest's cache directory
+    with RenderLog() as log:
+        assert str(log.db_path).startswith(os.environ["MOPS_CACHE_DIR"])
+    monkeypatch.setattr("utils.index.CACHE_DIR", tmp_path)
+    data = benchmark.synthetic_mop(25, section_size=10, repository=f"{tmp_path}/")
+    MOPModel(**data)
+    assert [len(steps) for steps in data["sections"].values()] == [10, 10, 5]
+
+    results = benchmark.run([1, 25], budget=0)
+    assert set(results[25]) == {"load", "validate", "render", "publish"}
+    assert results[25]["render"]["runs"] == 3
+    baseline = {"results": {"25": {"render": {"p50_ms": 1e-6}}}}
+    assert len(benchmark.regressions(results, baseline, 1.5)) == 1
+
+
+def test_fake_api_end_to_end(tmp_path, monkeypatch):
+    from utils import fake_api
+    from utils.gcal import GCal
+
+    api = fake_api.FakeAPI(projects=["COR", "NOC", "SUT"], missing=["NOC-2"])
+    server = fake_api.start(api)
+    monkeypatch.setenv(fake_api.FAKE_API_ENV, fake_api.base_url(server))
+    client = Atlassian()
+    client.ledger = PageLedger(tmp_path / "ledger.json")
+    assert client.jira_projects_list() == ["COR", "NOC", "SUT"]
+    assert client.jira_existing_tickets(["NOC-1", "NOC-2", "SYS-1"]) == {"NOC-1"}
+    page = [45428825, "TEST", "h1. Body"]
+    assert client.confluence_create_or_update(page) is True
+    assert client.confluence_create_or_update(page, force=True) is True
+    assert [p["version"]["number"] for p in api.pages.values()] == [2]
+    for _ in range(2):
+        client.jira_create_link(["NOC-1", "https://wiki/TEST", "TEST"], "mops-1")
+    assert len(api.links["NOC-1"]) == 1
+    # only missing or changed links are written, however often --link is used
+    page_id = client.confluence_page_id(45428825, "TEST")
+    links = [
+        # linked by URL above, now matched and keyed by its page id
+        ["NOC-1", "https://wiki/TEST", "TEST", page_id],
+        ["NOC-1", "https://wiki/B", "B", None],
+    ]
+    assert client.jira_reconcile_links(links) == {
+        "created": 1,
+        "updated": 1,
+        "unchanged": 0,
+    }
+    assert client.jira_reconcile_links(links) == {
+        "created": 0,
+        "updated": 0,
+        "unchanged": 2,
+    }
+    # the same page under a new URL and title keeps its one link
+    moved = [["NOC-1", "https://wiki/MOVED", "MOVED", page_id]]
+    assert client.jira_reconcile_links(moved)["updated"] == 1
+    assert len(api.links["NOC-1"]) == 2
+    assert api.links["NOC-1"][0]["object"] == {
+        "url": "https://wiki/MOVED",
+        "title": "MOVED",
+    }
+
+    events = [("0900", "1000", "2026-10-20", "NOC-1: TEST")]
+    gcal = GCal(str(tmp_path))
+    assert gcal.create_calendar_events(events) == ["created"]
+    assert GCal(str(tmp_path)).create_calendar_events(events) == ["exists"]
+    gcal.create_calendar_event(*events[0], event_id="0123456789abcdef")
+    gcal.create_calendar_event(*events[0], event_id="0123456789abcdef")
+    assert len(api.events["internal"]) == 2
+    server.shutdown()
+
+    throttled = fake_api.FakeAPI(throttle=1)
+    statuses = [throttled.request("GET", "/jira/rest/api/2/project")[0] for _ in "ab"]
+    assert statuses == [200, 429] and throttled.stats["throttled"] == 1
+
+    # runs against the fake API keep their ledger, tickets and jobs apart
+    env = dict(os.environ, MOPS_CACHE_DIR=str(tmp_path), MOPS_FAKE_API="http://x")
+    cache_dir = subprocess.run(
+        [sys.executable, "-c", "from utils.cache import CACHE_DIR; print(CACHE_DIR)"],
+        cwd=MOPS_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+    assert cache_dir == str(tmp_path / "fake-api")
+
+
+def test_split_publish(mop_dict, tmp_path, monkeypatch):
+    from utils import fake_api
+    from utils.render import CHILDREN_MACRO, split_mop
+
+    mop_dict.update(cleanups=[None], migration_table=[None], tech_equip=[None])
+    full = main.render_yaml(mop_dict, "mop")
+    assert "".join(main.stream_yaml(mop_dict, "mop")) == full
+    parent, children = split_mop(mop_dict)
+    assert CHILDREN_MACRO in parent
+    assert [title for title, _ in children] == [
+        "TEST 1 - TEST SECTION1",
+        "TEST 2 - TEST SECTION2",
+    ]
+    # jumper numbering continues across child pages
+    assert "Jumper #2:" in children[1][1]
+
+    api = fake_api.FakeAPI()
+    server = fake_api.start(api)
+    monkeypatch.setenv(fake_api.FAKE_API_ENV, fake_api.base_url(server))
+    client = Atlassian()
+    client.ledger = PageLedger(tmp_path / "ledger.json")
+    results = client.confluence_publish_split(1, "TEST", parent, children)
+    assert list(results.values()) == [True, True, True]
+
+    mop_dict["sections"]["TEST SECTION2"][0]["rh"] = "CHANGED"
+    parent, children = split_mop(mop_dict)
+    results = client.confluence_publish_split(1, "TEST", parent, children)
+    assert [title for title, pushed in results.items() if pushed] == [
+        "TEST 2 - TEST SECTION2"
+    ]
+    assert len(api.pages) == 3
+    server.shutdown()
@@ -0,0 +1,141 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+_MANIFEST_LOCK = threading.Lock()
+
+
+class ArchiveStore:
+    """Compressed, deduplicated archive of published MOP/CD YAMLs.
+
+    Lives in {repository}store/. Each distinct YAML is stored once as
+    blobs/{sha[:2]}/{sha}.yaml.gz, and manifest.jsonl maps each
+    (yaml_type, date, title) to a blob. Manifest lines are only appended, the
+    last line for a document wins, so the manifest syncs cleanly on shared
+    drives.
+    """
+
+    def __init__(self, repository: str):
+        self.repository = repository
+        self.root = Path(repository) / "store"
+        self.manifest_path = self.root / "manifest.jsonl"
+        self._entries: Optional[dict] = None
+        self._manifest_key = None
+
+    @staticmethod
+    def key(entry: dict) -> tuple:
+        return entry["yaml_type"], entry["date"], entry["title"]
+
+    def blob_path(self, blob: str) -> Path:
+        return self.root / "blobs" / blob[:2] / f"{blob}.yaml.gz"
+
+    def _load(self) -> dict:
+        """Return manifest as {(yaml_type, date, title): entry}, cached by stat."""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return {}
+        if self._entries is None or self._manifest_key != (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            entries = {}
+            with open(self.manifest_path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries[self.key(entry)] = entry
+            self._entries = entries
+            self._manifest_key = (stat.st_mtime_ns, stat.st_size)
+        return self._entries
+
+    def entries(self, yaml_type: Optional[str] = None) -> list:
+        """Return manifest entries, oldest first."""
+        entries = self._load().values()
+        if yaml_type:
+            entries = [e for e in entries if e["yaml_type"] == yaml_type]
+        return sorted(entries, key=lambda e: (e["date"], e["yaml_type"], e["title"]))
+
+    def put(self, source: str, yaml_type: str, date: str, title: str) -> dict:
+        """Archive source as (yaml_type, date, title) and return its entry."""
+        with open(source, "rb") as f:
+            return self.put_content(f.read(), yaml_type, date, title)
+
+    def put_content(
+        self, content: bytes, yaml_type: str, date: str, title: str
+    ) -> dict:
+        """Archive YAML bytes as (yaml_type, date, title) and return its entry.
+
+        The blob is only written if its content is new, and the manifest is
+        only appended to if the document now points at a different blob.
+        """
+        blob = hashlib.sha256(content).hexdigest()
+        blob_path = self.blob_path(blob)
+        if not blob_path.exists():
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = blob_path.with_suffix(f".{threading.get_ident()}.tmp")
+            with gzip.open(tmp, "wb") as f:
+                f.write(content)
+            os.replace(tmp, blob_path)
+
+        entry = {
+            "yaml_type": yaml_type,
+            "date": date,
+            "title": title,
+            "blob": blob,
+            "size": len(content),
+        }
+        with _MANIFEST_LOCK:
+            current = self._load().get(self.key(entry))
+            if not current or current["blob"] != blob:
+                self.root.mkdir(parents=True, exist_ok=True)
+                with open(self.manifest_path, "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+        return entry
+
+    def read(self, entry: dict) -> bytes:
+        """Return the original YAML bytes for an entry."""
+        with gzip.open(self.blob_path(entry["blob"]), "rb") as f:
+            return f.read()
+
+    def find(
+        self, title: str, date: Optional[str] = None, yaml_type: Optional[str] = None
+    ) -> Optional[dict]:
+        """Return the latest entry matching title, and date/type if given."""
+        title = title.replace("/", "_").replace(" ", "_")
+        matches = [
+            e
+            for e in self.entries(yaml_type)
+            if e["title"] == title and (not date or e["date"] == date)
+        ]
+        return matches[-1] if matches else None
+
+    def restore(self, entry: dict, destination: str) -> None:
+        """Write an archived YAML back out, ex. to mop.yaml."""
+        with open(destination, "wb") as f:
+            f.write(self.read(entry))
+
+    def import_flat(self) -> int:
+        """Import {date}_{title}.yaml files from the flat mop/ and cd/ folders.
+
+        Safe to re-run, files already in the store are skipped. Returns the
+        number of new documents.
+        """
+        imported = 0
+        for yaml_type in ("mop", "cd"):
+            folder = os.path.join(self.repository, yaml_type)
+            if not os.path.isdir(folder):
+                continue
+            for name in sorted(os.listdir(folder)):
+                stem, ext = os.path.splitext(name)
+                date, _, title = stem.partition("_")
+                if ext not in (".yaml", ".yml") or not title:
+                    continue
+                known = self._load().get((yaml_type, date, title))
+                entry = self.put(os.path.join(folder, name), yaml_type, date, title)
+                imported += known is None or known["blob"] != entry["blob"]
+        return imported
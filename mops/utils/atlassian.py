@@ -1,33 +1,93 @@
+import hashlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 import keyring
 from atlassian import Jira, Confluence
+from atlassian.errors import ApiError
+from requests import HTTPError
+
+from .cache import PageLedger
+from .fake_api import fake_api_url
+from .session import HTTPConfig, PooledSession
+from .timing import PROFILER
+
+# ticket keys per JQL search, keeps the query well under URL length limits
+JQL_KEYS = 100
+
+
+def link_global_id(ticket: str, page) -> str:
+    """Return the Jira remote link globalId mops uses for a ticket's page.
+
+    args:
+      page: Confluence page id, or the page URL if the page is not yet in the
+        ledger
+    """
+    return f"mops-{hashlib.sha256(f'{ticket}/{page}'.encode()).hexdigest()[:32]}"
 
 
 class Atlassian:
     """Base class for Jira & Confluence methods."""
 
     def __init__(self):
-        jira_url = keyring.get_password("jira", "url")
-        confluence_url = keyring.get_password("confluence", "url")
-        username = keyring.get_password("cas", "user")
-        password = keyring.get_password("cas", username)
+        fake_api = fake_api_url()
+        if fake_api:
+            jira_url = f"{fake_api}/jira"
+            confluence_url = f"{fake_api}/confluence"
+            username, password = "mops", "fake"
+        else:
+            with PROFILER.phase("keyring"):
+                jira_url = keyring.get_password("jira", "url")
+                confluence_url = keyring.get_password("confluence", "url")
+                username = keyring.get_password("cas", "user")
+                password = keyring.get_password("cas", username)
 
+        # PooledSession retries throttled requests itself, and strips
+        # Retry-After from its final response so the clients' own unbounded
+        # Retry-After loop never starts
+        config = HTTPConfig.from_env()
         self.jira = Jira(
             url=jira_url,
             username=username,
             password=password,
+            session=PooledSession(config),
+            timeout=config.timeout,
         )
         self.confluence = Confluence(
             url=confluence_url,
             username=username,
             password=password,
+            session=PooledSession(config),
+            timeout=config.timeout,
         )
+        self.ledger = PageLedger()
 
     def jira_projects_list(self) -> list:
         """Return list of Jira Projects."""
-        projects = self.jira.projects(included_archived=None)
+        with PROFILER.phase("jira_projects_fetch"):
+            projects = self.jira.projects(included_archived=None)
         return [project["key"] for project in projects]
 
-    def jira_create_link(self, link_data: list) -> None:
+    def jira_existing_tickets(self, keys: list) -> set:
+        """Return which of keys exist, with one JQL search per JQL_KEYS keys."""
+        existing = set()
+        with PROFILER.phase("jira_tickets"):
+            for start in range(0, len(keys), JQL_KEYS):
+                chunk = keys[start : start + JQL_KEYS]
+                # without validation Jira skips unknown keys instead of failing
+                results = self.jira.jql(
+                    f"key in ({', '.join(chunk)})",
+                    fields="key",
+                    limit=len(chunk),
+                    validate_query="false",
+                )
+                existing.update(issue["key"] for issue in results["issues"])
+        return existing
+
+    def jira_create_link(
+        self, link_data: list, global_id: Optional[str] = None
+    ) -> None:
         """Link Jira ticket to Confluence page.
 
         The Jira macro supplied in the Confluence template only creates a
@@ -38,17 +98,168 @@ class Atlassian:
           ticket: str
           link_title: url
           page_title: str
+        global_id: Jira updates the ticket's link with this id instead of
+          adding another one
         """
-        self.jira.create_or_update_issue_remote_links(
-            *link_data, relationship="mentioned in"
-        )
+        with PROFILER.phase("jira_link"):
+            self.jira.create_or_update_issue_remote_links(
+                *link_data, global_id=global_id, relationship="mentioned in"
+            )
+
+    def confluence_page_id(self, parent_page_id, page_title: str) -> Optional[str]:
+        """Return the id of a page from the ledger, None if never pushed."""
+        entry = self.ledger.get(parent_page_id, page_title)
+        return entry["page_id"] if entry else None
 
-    def confluence_create_or_update(self, page_data: tuple) -> None:
+    def jira_reconcile_links(self, links: list, workers: int = 4) -> dict:
+        """Make each ticket link to its Confluence pages, writing only what
+        is missing or out of date.
+
+        Existing links of every ticket are fetched in one pass, concurrently.
+        A page's link is found by its globalId, derived from the ticket and
+        page id, so its URL and title are updated in place. Links made before
+        the page id was known are found by URL and given the page's globalId.
+        A renamed document is published as a new page and gets its own link.
+
+        links: list of [ticket, url, page_title, page id or None]
+        Returns counts of 'created', 'updated' and 'unchanged' links.
+        """
+        wanted: dict = {}
+        for ticket, url, page_title, page_id in links:
+            global_id = link_global_id(ticket, page_id or url)
+            wanted.setdefault(ticket, {})[global_id] = (url, page_title)
+
+        def reconcile(ticket: str) -> Counter:
+            counts = Counter()
+            by_global_id, by_url = {}, {}
+            for link in self.jira.get_issue_remote_links(ticket) or []:
+                by_global_id.setdefault(link.get("globalId"), link)
+                by_url.setdefault(link["object"].get("url"), link)
+            for global_id, (url, page_title) in wanted[ticket].items():
+                link = by_global_id.get(global_id) or by_url.get(url)
+                if link is None:
+                    self.jira.create_or_update_issue_remote_links(
+                        ticket,
+                        url,
+                        page_title,
+                        global_id=global_id,
+                        relationship="mentioned in",
+                    )
+                    counts["created"] += 1
+                elif (
+                    link.get("globalId"),
+                    link["object"].get("url"),
+                    link["object"].get("title"),
+                ) != (global_id, url, page_title):
+                    self.jira.update_issue_remote_link_by_id(
+                        ticket,
+                        link["id"],
+                        url,
+                        page_title,
+                        global_id=global_id,
+                        relationship="mentioned in",
+                    )
+                    counts["updated"] += 1
+                else:
+                    counts["unchanged"] += 1
+            return counts
+
+        counts = Counter(created=0, updated=0, unchanged=0)
+        with PROFILER.phase("jira_link"), ThreadPoolExecutor(workers) as pool:
+            for ticket_counts in pool.map(reconcile, wanted):
+                counts.update(ticket_counts)
+        return dict(counts)
+
+    def confluence_create_or_update(
+        self, page_data: tuple, force: bool = False
+    ) -> bool:
         """Create or Update Confluence page.
 
+        Pushes are skipped when the rendered body matches the ledger entry for
+        the page, and pages already in the ledger are updated by id without a
+        title lookup. Returns False if the push was skipped.
+
         page_data: list in the form of:
           parent_page_id: int
           page_title: str
           rendered_mop: str, in Confluence Wiki format
+        force: push even if the body is unchanged
+        """
+        parent_page_id, page_title, body = page_data
+        digest = hashlib.sha256(body.encode()).hexdigest()
+        entry = self.ledger.get(parent_page_id, page_title)
+        if entry and entry["hash"] == digest and not force:
+            return False
+
+        with PROFILER.phase("confluence"):
+            page = None
+            if entry:
+                try:
+                    page = self.confluence.update_page(
+                        entry["page_id"],
+                        page_title,
+                        body,
+                        parent_id=parent_page_id,
+                        representation="wiki",
+                        always_update=True,
+                    )
+                except (ApiError, HTTPError):
+                    # page was removed or moved since the last push
+                    page = None
+            if not page:
+                page = self.confluence.update_or_create(
+                    *page_data, representation="wiki"
+                )
+
+        self.ledger.record(
+            parent_page_id,
+            page_title,
+            page["id"],
+            page.get("version", {}).get("number"),
+            digest,
+        )
+        return True
+
+    def confluence_publish_split(
+        self,
+        parent_page_id,
+        page_title: str,
+        body: str,
+        children: list,
+        force: bool = False,
+        workers: int = 4,
+    ) -> dict:
+        """Publish a page, then each chunk as a child page of it.
+
+        Each page is skipped independently when unchanged, and a failed chunk
+        does not stop the others, so a retry only pushes what is missing.
+        Returns dict of page title: False if the push was skipped.
+
+        children: list of (child title, body)
+        workers: child pages pushed at once
         """
-        self.confluence.update_or_create(*page_data, representation="wiki")
+        results = {
+            page_title: self.confluence_create_or_update(
+                [parent_page_id, page_title, body], force
+            )
+        }
+        page_id = self.ledger.get(parent_page_id, page_title)["page_id"]
+        failed = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                title: pool.submit(
+                    self.confluence_create_or_update, [page_id, title, text], force
+                )
+                for title, text in children
+            }
+            for title, future in futures.items():
+                try:
+                    results[title] = future.result()
+                except Exception as e:
+                    failed.append(f"{title}: {type(e).__name__}: {e}")
+        if failed:
+            raise RuntimeError(
+                f"{len(failed)} of {len(children)} child pages failed: "
+                + "; ".join(failed)
+            )
+        return results
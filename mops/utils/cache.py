@@ -0,0 +1,361 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import yaml
+
+# clients are pointed at a running FakeAPI by setting this to its base URL
+FAKE_API_ENV = "MOPS_FAKE_API"
+
+CACHE_DIR = Path(os.environ.get("MOPS_CACHE_DIR", Path.home() / ".cache" / "mops"))
+if os.environ.get(FAKE_API_ENV):
+    # keep fake pages, tickets and queued jobs out of the real caches
+    CACHE_DIR = CACHE_DIR / "fake-api"
+PROJECTS_TTL = 24 * 60 * 60
+# tickets are only cached once found, so a new ticket is never reported missing
+TICKETS_TTL = 60 * 60
+# libyaml parser when PyYAML was built with it
+YAMLLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class ProjectsCache:
+    """Disk-backed cache of Jira project keys.
+
+    The key list is read from disk when fresh, refetched from Jira once the TTL
+    has expired, and falls back to the last known list if Jira is unreachable.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], list],
+        path: Optional[Path] = None,
+        ttl: int = PROJECTS_TTL,
+    ):
+        self.fetch = fetch
+        self.path = Path(path) if path else CACHE_DIR / "jira_projects.json"
+        self.ttl = ttl
+        self._projects: Optional[frozenset] = None
+        self._loaded = 0.0
+        self._lock = threading.Lock()
+
+    def _fresh(self) -> bool:
+        """Return True if the in-memory keys are within the TTL."""
+        return self._projects is not None and time.time() - self._loaded < self.ttl
+
+    def _load(self) -> Optional[dict]:
+        """Return cache file contents, or None if missing or unreadable."""
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, projects: list) -> None:
+        """Atomically write project keys to the cache file."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"fetched": time.time(), "projects": sorted(projects)}, f)
+        os.replace(tmp, self.path)
+
+    def cached(self) -> Optional[frozenset]:
+        """Return the project keys in memory, None if not loaded yet."""
+        return self._projects
+
+    def seed(self, projects: Optional[Iterable[str]]) -> None:
+        """Use projects as fresh keys without reading the cache file or Jira.
+
+        Lets worker processes validate against the parent's keys. None
+        forgets the keys, so the next get() loads them again.
+        """
+        with self._lock:
+            self._projects = None if projects is None else frozenset(projects)
+            self._loaded = 0.0 if projects is None else time.time()
+
+    def refresh(self) -> frozenset:
+        """Fetch project keys from Jira and rewrite the cache."""
+        projects = self.fetch()
+        self._save(projects)
+        self._projects = frozenset(projects)
+        self._loaded = time.time()
+        return self._projects
+
+    def get(self) -> frozenset:
+        """Return project keys, refreshing from Jira only if the cache is stale."""
+        if self._fresh():
+            return self._projects
+        with self._lock:
+            return self._get()
+
+    def _get(self) -> frozenset:
+        if self._fresh():
+            return self._projects
+
+        cached = self._load()
+        if cached and time.time() - cached.get("fetched", 0) < self.ttl:
+            self._projects = frozenset(cached["projects"])
+            self._loaded = cached["fetched"]
+            return self._projects
+
+        try:
+            return self.refresh()
+        except Exception as e:
+            if not cached:
+                raise
+            print(f"Unable to refresh Jira projects ({e}), using cached list.")
+            self._projects = frozenset(cached["projects"])
+            # retry after another TTL rather than on every ticket
+            self._loaded = time.time()
+            return self._projects
+
+
+class TicketsCache:
+    """Disk-backed cache of Jira ticket keys known to exist.
+
+    Keys not found in the cache are looked up together in one call to fetch,
+    so checking every ticket of a document, or of a whole batch, costs at
+    most one Jira search.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[list], set],
+        path: Optional[Path] = None,
+        ttl: int = TICKETS_TTL,
+    ):
+        self.fetch = fetch
+        self.path = Path(path) if path else CACHE_DIR / "jira_tickets.json"
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        """Return {ticket: time found} of unexpired entries."""
+        try:
+            with open(self.path, "r") as f:
+                found = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        now = time.time()
+        return {key: at for key, at in found.items() if now - at < self.ttl}
+
+    def _save(self, found: dict) -> None:
+        """Atomically write found tickets to the cache file."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(found, f)
+        os.replace(tmp, self.path)
+
+    def missing(self, keys) -> set:
+        """Return the keys that do not exist in Jira."""
+        with self._lock:
+            found = self._load()
+            unknown = sorted(set(keys) - set(found))
+            if not unknown:
+                return set()
+            existing = set(self.fetch(unknown))
+            now = time.time()
+            found.update((key, now) for key in existing)
+            self._save(found)
+            return set(unknown) - existing
+
+
+@contextmanager
+def file_lock(path: Path):
+    """Hold an exclusive lock on path across processes, waiting for it.
+
+    Without fcntl, ex. on Windows, only threads of this process are
+    serialized, by the caller's own lock.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class PageLedger:
+    """Local record of what was last pushed to each Confluence page.
+
+    Entries are keyed by (parent_page_id, page_title) and hold the page id,
+    version and sha256 of the rendered body. The daemon, outbox worker and
+    CLI share the file, so it is re-read whenever another process rewrote
+    it, and records are merged into the current file under a file lock.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else CACHE_DIR / "confluence_ledger.json"
+        self._lock = threading.Lock()
+        self._entries: Optional[dict] = None
+        self._file_key = None
+
+    @staticmethod
+    def _key(parent_page_id, page_title: str) -> str:
+        return f"{parent_page_id}/{page_title}"
+
+    def _stat(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self) -> dict:
+        """Return entries, cached until the file changes."""
+        key = self._stat()
+        if self._entries is None or key != self._file_key:
+            try:
+                with open(self.path, "r") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+            self._file_key = key
+        return self._entries
+
+    def get(self, parent_page_id, page_title: str) -> Optional[dict]:
+        """Return the ledger entry for a page, or None if never pushed."""
+        with self._lock:
+            return self._load().get(self._key(parent_page_id, page_title))
+
+    def record(
+        self, parent_page_id, page_title: str, page_id, version, digest: str
+    ) -> None:
+        """Store a successful push and atomically rewrite the ledger, keeping
+        entries other processes recorded since it was read."""
+        with self._lock, file_lock(self.path.with_suffix(".lock")):
+            entries = self._load()
+            entries[self._key(parent_page_id, page_title)] = {
+                "page_id": str(page_id),
+                "version": version,
+                "hash": digest,
+            }
+            tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump(entries, f, indent=1)
+            os.replace(tmp, self.path)
+            self._file_key = self._stat()
+
+
+class YAMLCache:
+    """Parsed YAML documents keyed by path, mtime and size.
+
+    Entries are kept in memory for the session and pickled under the cache
+    dir between runs, along with the yaml types each document has passed
+    validation for. Returned documents are shared, treat them as read-only.
+    """
+
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = Path(directory) if directory else CACHE_DIR / "yaml"
+        self._entries: dict = {}
+        self._lock = threading.Lock()
+
+    def _disk_path(self, path: str) -> Path:
+        digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+        return self.directory / f"{digest}.pickle"
+
+    def _save(self, path: str, entry: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        disk_path = self._disk_path(path)
+        tmp = disk_path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, disk_path)
+
+    def _entry(self, path: str) -> dict:
+        """Return the current entry for path, parsing only if it changed."""
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        path = os.path.abspath(path)
+        entry = self._entries.get(path)
+        if entry and entry["key"] == key:
+            return entry
+
+        try:
+            with open(self._disk_path(path), "rb") as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            entry = None
+        if not entry or entry["key"] != key or "validated" not in entry:
+            with open(path, "r") as f:
+                entry = {"key": key, "data": yaml.load(f, Loader=YAMLLoader)}
+            # yaml_type -> validation_fingerprint it passed with
+            entry["validated"] = {}
+            self._save(path, entry)
+        self._entries[path] = entry
+        return entry
+
+    def load(self, path: str):
+        """Return parsed document at path."""
+        with self._lock:
+            return self._entry(path)["data"]
+
+    def is_valid(self, path: str, yaml_type: str, fingerprint: str) -> bool:
+        """Return True if the unchanged document already passed validation.
+
+        fingerprint must match the one it was marked valid with, see
+        validation_fingerprint.
+        """
+        with self._lock:
+            return self._entry(path)["validated"].get(yaml_type) == fingerprint
+
+    def mark_valid(self, path: str, yaml_type: str, fingerprint: str) -> None:
+        """Record that the current document passed validation as yaml_type."""
+        with self._lock:
+            entry = self._entry(path)
+            if entry["validated"].get(yaml_type) != fingerprint:
+                entry["validated"][yaml_type] = fingerprint
+                self._save(path, entry)
+
+
+@lru_cache(maxsize=None)
+def _schema_digest() -> str:
+    return hashlib.sha1(Path(__file__).with_name("schema.py").read_bytes()).hexdigest()
+
+
+def validation_fingerprint(data) -> str:
+    """Return what a passed validation depends on besides the YAML itself.
+
+    That is the schema code, the Jira project keys and whether the
+    repository and gcal_auth_path directories exist, so a change to any of
+    them invalidates the memo in YAMLCache.
+    """
+    data = data if isinstance(data, dict) else {}
+    paths = [
+        (key, str(data[key]), os.path.isdir(str(data[key])))
+        for key in ("repository", "gcal_auth_path")
+        if data.get(key)
+    ]
+    payload = json.dumps([_schema_digest(), sorted(JIRA_PROJECTS.get()), paths])
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def fetch_jira_projects() -> list:
+    """Return project keys from Jira, only called when the cache is stale."""
+    from .atlassian import Atlassian
+
+    return Atlassian().jira_projects_list()
+
+
+def fetch_jira_tickets(keys: list) -> set:
+    """Return which ticket keys exist, only called for keys not cached."""
+    from .atlassian import Atlassian
+
+    return Atlassian().jira_existing_tickets(keys)
+
+
+JIRA_PROJECTS = ProjectsCache(fetch_jira_projects)
+JIRA_TICKETS = TicketsCache(fetch_jira_tickets)
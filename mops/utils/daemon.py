@@ -0,0 +1,89 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+from .cache import CACHE_DIR
+
+SOCKET_PATH = CACHE_DIR / "mops.sock"
+
+
+def _listening(path: Path) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(path))
+        return True
+    except OSError:
+        return False
+
+
+def request(argv: list, cwd: str, path: Path = SOCKET_PATH) -> Optional[dict]:
+    """Run a mops command in the daemon.
+
+    Returns {"code": int, "output": str}, or None if no daemon is listening so
+    the caller can run the command in-process.
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(path))
+            sock.sendall(json.dumps({"argv": argv, "cwd": cwd}).encode() + b"\n")
+            sock.shutdown(socket.SHUT_WR)
+            response = b"".join(iter(lambda: sock.recv(65536), b""))
+        # a daemon killed mid-reply leaves a truncated or empty response
+        return json.loads(response)
+    except (ConnectionRefusedError, FileNotFoundError, ValueError):
+        return None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # connection probe from _listening
+            return
+        try:
+            payload = json.loads(line)
+            # commands chdir and redirect stdout, so run one at a time
+            with self.server.lock:
+                code, output = self.server.run(payload["argv"], payload["cwd"])
+        except Exception as e:
+            code, output = 1, f"mops daemon error: {type(e).__name__}: {e}\n"
+        self.wfile.write(json.dumps({"code": code, "output": output}).encode())
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(run: Callable[[list, str], tuple], path: Path = SOCKET_PATH) -> None:
+    """Serve mops commands on a Unix socket until interrupted.
+
+    args:
+      run: callable(argv, cwd) returning (exit code, captured output)
+      path: socket path
+    """
+    if _listening(path):
+        raise RuntimeError(f"mops daemon already listening on {path}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        # left behind by a daemon that did not shut down cleanly
+        path.unlink()
+
+    # create the socket owner-only, there is no window before a chmod
+    umask = os.umask(0o177)
+    try:
+        server = _Server(str(path), _Handler)
+    finally:
+        os.umask(umask)
+    server.run = run
+    server.lock = threading.Lock()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        path.unlink(missing_ok=True)
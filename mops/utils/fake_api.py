@@ -0,0 +1,349 @@
+import email
+import itertools
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+from .cache import FAKE_API_ENV
+from .session import TokenBucket
+
+JIRA = "/jira/rest/api/2"
+CONFLUENCE = "/confluence/rest/api/content"
+CALENDAR = "/google/calendar/v3/calendars/(?P<calendar>[^/]+)/events"
+# (method, path pattern, FakeAPI method)
+ROUTES = [
+    ("GET", f"{JIRA}/project", "jira_projects"),
+    ("GET", f"{JIRA}/search", "jira_search"),
+    ("GET", f"{JIRA}/issue/(?P<issue>[^/]+)/remotelink", "jira_links"),
+    ("POST", f"{JIRA}/issue/(?P<issue>[^/]+)/remotelink", "jira_link"),
+    (
+        "PUT",
+        rf"{JIRA}/issue/(?P<issue>[^/]+)/remotelink/(?P<link_id>\d+)",
+        "jira_link_update",
+    ),
+    ("GET", f"{CONFLUENCE}/?", "confluence_search"),
+    ("POST", f"{CONFLUENCE}/?", "confluence_create"),
+    ("GET", rf"{CONFLUENCE}/(?P<page_id>\d+)/history", "history"),
+    ("GET", rf"{CONFLUENCE}/(?P<page_id>\d+)", "confluence_page"),
+    ("PUT", rf"{CONFLUENCE}/(?P<page_id>\d+)", "confluence_update"),
+    ("GET", CALENDAR, "gcal_list"),
+    ("POST", CALENDAR, "gcal_insert"),
+]
+ROUTES = [(method, re.compile(path + "$"), name) for method, path, name in ROUTES]
+BATCH_PATH = "/google/batch/calendar/v3"
+# space of Confluence pages the server has not seen, ex. parent pages
+DEFAULT_SPACE = "Core"
+
+
+class FakeAPI:
+    """In-memory stand-in for the Jira, Confluence and Google Calendar
+    endpoints used by mops, for offline load and latency testing.
+
+    Every request waits latency +/- jitter seconds. Requests above throttle
+    per second get 429 with Retry-After, and error_rate of the rest get 500.
+    Pages, remote links and events are kept until the server stops.
+
+    args:
+      latency: mean seconds added to each request
+      jitter: maximum seconds either side of latency
+      error_rate: fraction of requests answered with 500, 0 to 1
+      throttle: requests per second before 429, 0 for no limit
+      projects: Jira project keys
+      missing: ticket keys that do not exist, every other key of a project does
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        throttle: float = 0.0,
+        projects: Iterable[str] = ("COR", "NOC"),
+        missing: Iterable[str] = (),
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle = throttle
+        self.projects = list(projects)
+        self.missing = set(missing)
+        self.bucket = TokenBucket(throttle, max(int(throttle), 1)) if throttle else None
+        self.pages: dict = {}
+        self.links: dict = {}
+        self.events: dict = {}
+        self.stats: Counter = Counter()
+        self._ids = itertools.count(10_000_000)
+        self._lock = threading.Lock()
+
+    def request(
+        self, method: str, target: str, body: bytes = b"", content_type: str = ""
+    ) -> tuple:
+        """Handle one HTTP request, returns (status, headers, body bytes)."""
+        url = urlsplit(target)
+        if url.path == "/_fake/stats":
+            return self._json(200, dict(self.stats))
+
+        if self.latency or self.jitter:
+            time.sleep(max(self.latency + random.uniform(-1, 1) * self.jitter, 0))
+        if self.bucket and not self.bucket.try_acquire():
+            self.count("throttled")
+            retry = str(math.ceil(1 / self.throttle))
+            status, headers, data = self._json(429, {"message": "Rate limited"})
+            return status, {**headers, "Retry-After": retry}, data
+        if random.random() < self.error_rate:
+            self.count("errors")
+            return self._json(500, {"errorMessages": ["Injected server error"]})
+
+        if method == "POST" and url.path == BATCH_PATH:
+            return self.batch(body, content_type)
+        return self._json(*self.dispatch(method, target, body))
+
+    def dispatch(self, method: str, target: str, body: bytes = b"") -> tuple:
+        """Route a request to its endpoint, returns (status, JSON payload)."""
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        payload = json.loads(body) if body else {}
+        for route_method, pattern, name in ROUTES:
+            match = pattern.match(url.path)
+            if match and route_method == method:
+                self.count(name)
+                with self._lock:
+                    return getattr(self, name)(params, payload, **match.groupdict())
+        self.count("not_found")
+        return 404, {"errorMessages": [f"No fake endpoint for {method} {url.path}"]}
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    @staticmethod
+    def _json(status: int, payload) -> tuple:
+        if payload is None:
+            # 204 No Content
+            return status, {}, b""
+        return (
+            status,
+            {"Content-Type": "application/json"},
+            json.dumps(payload).encode(),
+        )
+
+    def batch(self, body: bytes, content_type: str) -> tuple:
+        """Answer a Calendar multipart/mixed batch, one part per request."""
+        self.count("gcal_batch")
+        message = email.message_from_bytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for part in message.get_payload():
+            request_line, _, rest = (
+                part.get_payload().replace("\r\n", "\n").partition("\n")
+            )
+            method, target, _ = request_line.split(" ", 2)
+            part_body = rest.partition("\n\n")[2].strip()
+            status, payload = self.dispatch(method, target, part_body.encode())
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{part['Content-ID'][1:]}\r\n\r\n"
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: application/json\r\n\r\n{json.dumps(payload)}\r\n"
+            )
+        data = ("".join(parts) + f"--{boundary}--\r\n").encode()
+        return 200, {"Content-Type": f"multipart/mixed; boundary={boundary}"}, data
+
+    # Jira
+
+    def jira_projects(self, params: dict, payload: dict) -> tuple:
+        return 200, [{"key": key, "name": key} for key in self.projects]
+
+    def jira_search(self, params: dict, payload: dict) -> tuple:
+        """Answer 'key in (...)' searches, the only JQL mops sends."""
+        match = re.fullmatch(r"key in \((.*)\)", params.get("jql", ""))
+        if not match:
+            return 400, {"errorMessages": ["Only 'key in (...)' is supported"]}
+        keys = [key.strip() for key in match.group(1).split(",")]
+        issues = [
+            {"key": key}
+            for key in keys
+            if key.split("-")[0] in self.projects and key not in self.missing
+        ]
+        return 200, {"startAt": 0, "total": len(issues), "issues": issues}
+
+    def jira_links(self, params: dict, payload: dict, issue: str) -> tuple:
+        links = self.links.get(issue, [])
+        if "globalId" in params:
+            links = [
+                link for link in links if link.get("globalId") == params["globalId"]
+            ]
+        return 200, links
+
+    def jira_link(self, params: dict, payload: dict, issue: str) -> tuple:
+        """Create a remote link, or update the one with the same globalId."""
+        links = self.links.setdefault(issue, [])
+        for link in links:
+            if payload.get("globalId") and link.get("globalId") == payload["globalId"]:
+                link.update(payload)
+                return 200, {"id": link["id"], "self": link["self"]}
+        link_id = next(self._ids)
+        link = {
+            "id": link_id,
+            "self": f"/jira/rest/api/2/issue/{issue}/remotelink/{link_id}",
+        }
+        links.append({**payload, **link})
+        return 201, link
+
+    def jira_link_update(
+        self, params: dict, payload: dict, issue: str, link_id: str
+    ) -> tuple:
+        for link in self.links.get(issue, []):
+            if str(link["id"]) == link_id:
+                link.update(payload)
+                return 204, None
+        return 404, {"errorMessages": [f"No remote link {link_id} on {issue}"]}
+
+    # Confluence
+
+    def _page(self, page_id: str) -> dict:
+        """Return a page, inventing pages the server has not seen as parents."""
+        return self.pages.get(page_id) or {
+            "id": page_id,
+            "type": "page",
+            "title": f"Page {page_id}",
+            "space": {"key": DEFAULT_SPACE},
+            "version": {"number": 1},
+        }
+
+    def confluence_page(self, params: dict, payload: dict, page_id: str) -> tuple:
+        return 200, self._page(page_id)
+
+    def history(self, params: dict, payload: dict, page_id: str) -> tuple:
+        if page_id not in self.pages:
+            return 404, {"message": f"No content with id {page_id}"}
+        return 200, {"lastUpdated": self.pages[page_id]["version"]}
+
+    def _find(self, title: Optional[str], space: Optional[str]) -> list:
+        return [
+            page
+            for page in self.pages.values()
+            if page["title"] == title and (not space or page["space"]["key"] == space)
+        ]
+
+    def confluence_search(self, params: dict, payload: dict) -> tuple:
+        results = self._find(params.get("title"), params.get("spaceKey"))
+        return 200, {"results": results, "size": len(results)}
+
+    def confluence_create(self, params: dict, payload: dict) -> tuple:
+        space = payload.get("space", {}).get("key") or DEFAULT_SPACE
+        if self._find(payload["title"], space):
+            return 400, {"message": "A page with this title already exists"}
+        page_id = str(next(self._ids))
+        self.pages[page_id] = {
+            "id": page_id,
+            "type": payload.get("type", "page"),
+            "title": payload["title"],
+            "space": {"key": space},
+            "version": {"number": 1},
+            "body": payload.get("body", {}),
+            "ancestors": payload.get("ancestors", []),
+            "_links": {"tinyui": f"/x/{page_id}"},
+        }
+        return 200, self.pages[page_id]
+
+    def confluence_update(self, params: dict, payload: dict, page_id: str) -> tuple:
+        page = self.pages.get(page_id)
+        if page is None:
+            return 404, {"message": f"No content with id {page_id}"}
+        version = payload.get("version", {}).get("number")
+        if version != page["version"]["number"] + 1:
+            return 409, {"message": f"Version {version} conflicts with the page"}
+        page.update(
+            title=payload.get("title", page["title"]),
+            body=payload.get("body", page.get("body", {})),
+            version={"number": version},
+            ancestors=payload.get("ancestors", page.get("ancestors", [])),
+        )
+        return 200, page
+
+    # Google Calendar
+
+    def gcal_list(self, params: dict, payload: dict, calendar: str) -> tuple:
+        start, end = params.get("timeMin", "")[:19], params.get("timeMax", "~")[:19]
+        items = [
+            event
+            for event in self.events.get(calendar, {}).values()
+            if start <= event["start"].get("dateTime", "")[:19] < end
+        ]
+        return 200, {"kind": "calendar#events", "items": items}
+
+    def gcal_insert(self, params: dict, payload: dict, calendar: str) -> tuple:
+        events = self.events.setdefault(calendar, {})
+        event_id = payload.get("id") or uuid.uuid4().hex
+        if event_id in events:
+            return 409, {
+                "error": {
+                    "code": 409,
+                    "message": "The requested identifier already exists.",
+                }
+            }
+        events[event_id] = {**payload, "id": event_id, "status": "confirmed"}
+        return 200, events[event_id]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, so pooled clients reuse connections as they would in production
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes, which Nagle's algorithm
+    # and delayed ACKs otherwise hold back by ~40 ms per keep-alive request
+    disable_nagle_algorithm = True
+
+    def handle_request(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        status, headers, data = self.server.api.request(
+            self.command,
+            self.path,
+            self.rfile.read(length),
+            self.headers.get("Content-Type", ""),
+        )
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+    def log_message(self, *args):
+        pass
+
+
+def start(api: FakeAPI, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serve api from a background thread, returns the running server.
+
+    Its base URL is f"http://{host}:{server.server_port}".
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.api = api
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def fake_api_url() -> Optional[str]:
+    """Return the FakeAPI base URL clients should use, if one is configured."""
+    return os.environ.get(FAKE_API_ENV) or None
@@ -1,50 +1,132 @@
+import json
 import os
-import pickle
-from datetime import date, datetime
+import sys
+import threading
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Optional
 
 import keyring
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from .fake_api import fake_api_url
+from .timing import PROFILER
 
-class GCal:
-    def __init__(self, gcal_auth_path: str):
-        # If modifying these scopes, delete the file token.pickle.
-        SCOPES = ["https://www.googleapis.com/auth/calendar.events"]
-        creds = None
+# If modifying these scopes, delete the file gcal_token.json.
+SCOPES = ["https://www.googleapis.com/auth/calendar.events"]
+TIMEZONE = "America/Los_Angeles"
+# maximum calls per Calendar API batch request
+BATCH_LIMIT = 50
+
+# one Calendar service per auth path for the life of the process
+_SERVICES: dict = {}
+_SERVICES_LOCK = threading.Lock()
+
+
+def load_credentials(gcal_auth_path: str) -> Credentials:
+    """Return valid credentials, only rewriting the token if it changed."""
+    token_path = os.path.join(gcal_auth_path, "gcal_token.json")
+    creds = None
 
-        if os.path.exists(f"{gcal_auth_path}/gcal_token.json"):
-            creds = Credentials.from_authorized_user_file(
-                f"{gcal_auth_path}gcal_token.json", SCOPES
+    if os.path.exists(token_path):
+        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
+    # If there are no (valid) credentials available, let the user log in.
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            # only needed for the one-time browser login
+            from google_auth_oauthlib.flow import InstalledAppFlow
+
+            flow = InstalledAppFlow.from_client_secrets_file(
+                os.path.join(gcal_auth_path, "desktop_oauth_gcal.json"), SCOPES
             )
-        # If there are no (valid) credentials available, let the user log in.
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
+            creds = flow.run_local_server(port=0)
+
+        # Save the credentials for the next run
+        with open(token_path, "w") as token:
+            token.write(creds.to_json())
+    return creds
+
 
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    f"{gcal_auth_path}desktop_oauth_gcal.json", SCOPES
-                )
-                creds = flow.run_local_server(port=0)
+def event_body(start_time: str, end_time: str, day: str, title: str) -> dict:
+    """Return Calendar API event body.
 
-            # Save the credentials for the next run
-            with open(f"{gcal_auth_path}gcal_token.json", "w") as token:
-                token.write(creds.to_json())
+    Args:
+        start_time (str): start time (military)
+        end_time (str): end time (military)
+        day (str): day (can be 'today')
+        title (str): title for the event
+    """
+    start_day = date.today() if day == "today" else date.fromisoformat(str(day))
 
-        try:
-            self.service = build("calendar", "v3", credentials=creds)
+    start_hour = int(start_time[0:2])
+    start_min = int(start_time[2:4])
+    end_hour = int(end_time[0:2])
+    end_min = int(end_time[2:4])
 
-        except HttpError as error:
-            print("An error occurred: %s" % error)
+    start_iso = datetime(
+        start_day.year, start_day.month, start_day.day, start_hour, start_min
+    ).isoformat()
+    end_iso = datetime(
+        start_day.year, start_day.month, start_day.day, end_hour, end_min
+    ).isoformat()
 
-        self.service = build("calendar", "v3", credentials=creds)
-        self.internal_cal_url = keyring.get_password("internal_cal", "url")
+    # Create calendar dict to create event
+    return {
+        "summary": title,
+        "start": {"timeZone": TIMEZONE, "dateTime": start_iso},
+        "end": {"timeZone": TIMEZONE, "dateTime": end_iso},
+    }
+
+
+@lru_cache(maxsize=None)
+def internal_calendar_url() -> str:
+    """Return the Internal Calendar id from keyring, read once per process."""
+    with PROFILER.phase("keyring"):
+        return keyring.get_password("internal_cal", "url")
+
+
+def fake_service(url: str):
+    """Return a Calendar service whose requests, batches included, go to FakeAPI."""
+    from google.auth.credentials import AnonymousCredentials
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+
+    document = json.loads(get_static_doc("calendar", "v3"))
+    # batch requests are sent to rootUrl rather than the api_endpoint option
+    document["rootUrl"] = f"{url}/google/"
+    return build_from_document(document, credentials=AnonymousCredentials())
+
+
+class GCal:
+    def __init__(self, gcal_auth_path: str):
+        fake_api = fake_api_url()
+        with _SERVICES_LOCK:
+            if fake_api and gcal_auth_path not in _SERVICES:
+                _SERVICES[gcal_auth_path] = fake_service(fake_api)
+            elif gcal_auth_path not in _SERVICES:
+                creds = load_credentials(gcal_auth_path)
+                # static_discovery uses the discovery document bundled with
+                # googleapiclient instead of fetching it over the network
+                with PROFILER.phase("gcal_build"):
+                    try:
+                        _SERVICES[gcal_auth_path] = build(
+                            "calendar",
+                            "v3",
+                            credentials=creds,
+                            static_discovery=True,
+                        )
+                    except HttpError as error:
+                        sys.exit("An error occurred: %s" % error)
+        self.service = _SERVICES[gcal_auth_path]
+        self.internal_cal_url = "internal" if fake_api else internal_calendar_url()
+        self._day_index: dict = {}
 
-    def create_calendar_event(self, *args: str):
+    def create_calendar_event(self, *args: str, event_id: Optional[str] = None):
         """Creates Internal Calendar Event
 
         Args:
@@ -52,31 +134,113 @@ class GCal:
             end_time (str): end time (military)
             day (str): day (can be 'today')
             title (str): title for the event
+            event_id (str): optional base32hex id, an event already created
+                with it is left as is
         """
-        start_day = (
-            date.today() if args[2] == "today" else date.fromisoformat(str(args[2]))
-        )
+        body = event_body(*args)
+        if event_id:
+            body["id"] = event_id
+
+        with PROFILER.phase("gcal_event"):
+            try:
+                self.service.events().insert(
+                    calendarId=self.internal_cal_url,
+                    body=body,
+                ).execute()
+            except HttpError as error:
+                if not (event_id and error.resp.status == 409):
+                    raise
 
-        start_hour = int(args[0][0:2])
-        start_min = int(args[0][2:4])
-        end_hour = int(args[1][0:2])
-        end_min = int(args[1][2:4])
-
-        start_iso = datetime(
-            start_day.year, start_day.month, start_day.day, start_hour, start_min
-        ).isoformat()
-        end_iso = datetime(
-            start_day.year, start_day.month, start_day.day, end_hour, end_min
-        ).isoformat()
-
-        # Create calendar dict to create event
-        body = {
-            "summary": args[3],
-            "start": {"timeZone": "America/Los_Angeles", "dateTime": start_iso},
-            "end": {"timeZone": "America/Los_Angeles", "dateTime": end_iso},
-        }
-
-        self.service.events().insert(
+    def list_events(self, day: date) -> list:
+        """Return Internal Calendar events from the day before day to the
+        day after, so events near midnight in any timezone are included."""
+        events = []
+        request = self.service.events().list(
             calendarId=self.internal_cal_url,
-            body=body,
-        ).execute()
+            timeMin=f"{day - timedelta(days=1)}T00:00:00Z",
+            timeMax=f"{day + timedelta(days=2)}T00:00:00Z",
+            timeZone=TIMEZONE,
+            singleEvents=True,
+        )
+        with PROFILER.phase("gcal_list"):
+            while request is not None:
+                response = request.execute()
+                events.extend(response.get("items", []))
+                request = self.service.events().list_next(request, response)
+        return events
+
+    def day_index(self, day: date) -> set:
+        """Return (summary, start) keys of Internal Calendar events on day.
+
+        Fetched once per day per GCal instance.
+        """
+        if day not in self._day_index:
+            self._day_index[day] = {
+                (event.get("summary"), event["start"]["dateTime"][:19])
+                for event in self.list_events(day)
+                if event.get("start", {}).get("dateTime")
+            }
+        return self._day_index[day]
+
+    def day_windows(self, day: date) -> list:
+        """Return (summary, start, end) of timed events around day, times as
+        local 'YYYY-MM-DDTHH:MM'."""
+        return [
+            (
+                event.get("summary"),
+                event["start"]["dateTime"][:16],
+                event["end"]["dateTime"][:16],
+            )
+            for event in self.list_events(day)
+            if event.get("start", {}).get("dateTime")
+            and event.get("end", {}).get("dateTime")
+        ]
+
+    def create_calendar_events(self, events: list) -> list:
+        """Creates Internal Calendar Events through batch HTTP requests.
+
+        Events already on the Internal Calendar with the same title and start,
+        or repeated in events, are skipped. Inserts are sent BATCH_LIMIT at a
+        time.
+
+        Args:
+            events (list): (start_time, end_time, day, title) tuples
+        Returns list of 'created', 'exists' or 'failed: {error}' per event.
+        """
+        results = [""] * len(events)
+        pending = []
+        for index, event in enumerate(events):
+            body = event_body(*event)
+            day = date.fromisoformat(body["start"]["dateTime"][:10])
+            keys = self.day_index(day)
+            key = (body["summary"], body["start"]["dateTime"])
+            if key in keys:
+                results[index] = "exists"
+                continue
+            keys.add(key)
+            pending.append((index, key, body))
+
+        def callback(request_id, response, exception):
+            index = int(request_id)
+            if exception is None:
+                results[index] = "created"
+            else:
+                results[index] = f"failed: {exception}"
+
+        with PROFILER.phase("gcal_event"):
+            for chunk in range(0, len(pending), BATCH_LIMIT):
+                batch = self.service.new_batch_http_request(callback=callback)
+                for index, _, body in pending[chunk : chunk + BATCH_LIMIT]:
+                    batch.add(
+                        self.service.events().insert(
+                            calendarId=self.internal_cal_url, body=body
+                        ),
+                        request_id=str(index),
+                    )
+                batch.execute()
+
+        # failed inserts may be retried by a later call
+        for index, key, _ in pending:
+            if results[index] != "created":
+                self._day_index[date.fromisoformat(key[1][:10])].discard(key)
+        return results
@@ -0,0 +1,303 @@
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional
+
+import yaml
+
+from .archive import ArchiveStore
+from .cache import CACHE_DIR, YAMLLoader
+from .jumpers import stored_tables
+
+# jumper keys indexed for both the a and z side, see schema.VALID_JUMPER_ITEMS
+JUMPER_KINDS = ("device", "port", "cage", "rack", "cable", "label", "cid")
+
+# ref kinds shared by two changes that make overlapping windows a conflict
+CONFLICT_KINDS = ("device", "rack")
+# windows start and end on start_day, or end the next day if they cross
+# midnight, so none is longer than this
+MAX_WINDOW = timedelta(days=1)
+# Internal Calendar events are refetched after this many seconds
+EVENTS_TTL = 15 * 60
+
+# bump when the tables change, the index is rebuilt from the archive
+SCHEMA_VERSION = 3
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    key TEXT PRIMARY KEY,
+    store TEXT NOT NULL,
+    blob TEXT NOT NULL,
+    yaml_type TEXT NOT NULL,
+    date TEXT,
+    title TEXT
+);
+CREATE TABLE IF NOT EXISTS refs (
+    key TEXT NOT NULL REFERENCES documents(key) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS refs_value ON refs(value, kind);
+CREATE INDEX IF NOT EXISTS refs_key ON refs(key);
+CREATE INDEX IF NOT EXISTS documents_store ON documents(store);
+CREATE TABLE IF NOT EXISTS windows (
+    key TEXT NOT NULL REFERENCES documents(key) ON DELETE CASCADE,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS windows_start ON windows(start);
+CREATE TABLE IF NOT EXISTS events (
+    day TEXT NOT NULL,
+    summary TEXT,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_day ON events(day);
+CREATE TABLE IF NOT EXISTS event_days (
+    day TEXT PRIMARY KEY,
+    fetched REAL NOT NULL
+);
+"""
+
+
+def document_refs(data: dict) -> set:
+    """Return (kind, value) pairs referenced by a MOP or CD document.
+
+    Values are stripped and lowercased so searches are case-insensitive.
+    """
+    refs = set()
+
+    def add(kind: str, value) -> None:
+        if value not in (None, ""):
+            refs.add((kind, str(value).strip().lower()))
+
+    add("ticket", data.get("ticket"))
+    add("ticket", data.get("approval"))
+    for ticket in data.get("shipping") or {}:
+        add("ticket", ticket)
+    for cable in data.get("nb_cables") or {}:
+        add("cable", cable)
+    for device in data.get("nb_devices") or {}:
+        add("device", device)
+    # CD changes are keyed by device
+    for device in data.get("changes") or {}:
+        add("device", device)
+
+    for section in (data.get("sections") or {}).values():
+        for step in section or []:
+            jumpers = step.get("jumper") if isinstance(step, dict) else None
+            for jumper in (jumpers or [])[1:]:
+                if not isinstance(jumper, dict):
+                    continue
+                for key, value in jumper.items():
+                    if key[1:] in JUMPER_KINDS:
+                        add(key[1:], value)
+    # jumper_source CSVs are stored in archived MOPs
+    for table in stored_tables(data):
+        for key, values in table.columns.items():
+            if key[1:] in JUMPER_KINDS:
+                for value in set(values):
+                    add(key[1:], value)
+    return refs
+
+
+def change_window(data: dict, archived: Optional[str] = None) -> Optional[tuple]:
+    """Return a CD's (start, end) as 'YYYY-MM-DDTHH:MM', None if unscheduled.
+
+    args:
+      data: document with start_day, start_time and end_time
+      archived: archive date, the day a start_day of 'today' refers to
+    """
+    start_day, start_time, end_time = (
+        data.get("start_day"),
+        data.get("start_time"),
+        data.get("end_time"),
+    )
+    if not (start_day and start_time and end_time):
+        return None
+    try:
+        if start_day == "today":
+            day = date.fromisoformat(archived) if archived else date.today()
+        else:
+            day = date.fromisoformat(str(start_day))
+        start = datetime.combine(day, datetime.strptime(str(start_time), "%H%M").time())
+        end = datetime.combine(day, datetime.strptime(str(end_time), "%H%M").time())
+    except ValueError:
+        return None
+    if end <= start:
+        end += timedelta(days=1)
+    return start.isoformat(timespec="minutes"), end.isoformat(timespec="minutes")
+
+
+class ArchiveIndex:
+    """SQLite index of the archive store written by move_yaml.
+
+    Maps tickets, devices, ports, cages, racks, cables, labels and CIDs to
+    archived documents, and holds the change window of each scheduled CD. A
+    document is only re-read when the manifest points it at a new blob.
+    """
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = Path(db_path) if db_path else CACHE_DIR / "archive.sqlite3"
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            # every table, children first, so nothing outlives its schema
+            self.conn.executescript(
+                "DROP TABLE IF EXISTS windows; DROP TABLE IF EXISTS refs; "
+                "DROP TABLE IF EXISTS documents; DROP TABLE IF EXISTS events; "
+                "DROP TABLE IF EXISTS event_days;"
+            )
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def document_key(store: ArchiveStore, entry: dict) -> str:
+        return f"{store.root}/{entry['yaml_type']}/{entry['date']}_{entry['title']}"
+
+    def add(self, store: ArchiveStore, entry: dict) -> None:
+        """Index or re-index a single archived document."""
+        key = self.document_key(store, entry)
+        data = yaml.load(store.read(entry), Loader=YAMLLoader) or {}
+        with self.conn:
+            self.conn.execute("DELETE FROM documents WHERE key = ?", (key,))
+            self.conn.execute(
+                "INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    str(store.root),
+                    entry["blob"],
+                    entry["yaml_type"],
+                    entry["date"],
+                    entry["title"],
+                ),
+            )
+            self.conn.executemany(
+                "INSERT INTO refs VALUES (?, ?, ?)",
+                [(key, kind, value) for kind, value in document_refs(data)],
+            )
+            window = change_window(data, entry["date"])
+            if window:
+                self.conn.execute(
+                    "INSERT INTO windows VALUES (?, ?, ?)", (key, *window)
+                )
+
+    def update(self, store: ArchiveStore) -> tuple:
+        """Bring the index up to date with the store's manifest.
+
+        Returns (indexed, removed) document counts.
+        """
+        known = dict(
+            self.conn.execute(
+                "SELECT key, blob FROM documents WHERE store = ?", (str(store.root),)
+            )
+        )
+        indexed = 0
+        for entry in store.entries():
+            key = self.document_key(store, entry)
+            if known.pop(key, None) != entry["blob"]:
+                try:
+                    self.add(store, entry)
+                    indexed += 1
+                except Exception as e:
+                    print(f"\tUnable to index {entry['title']}: {e}")
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM documents WHERE key = ?", [(k,) for k in known]
+            )
+        return indexed, len(known)
+
+    def search(self, query: str, kind: Optional[str] = None) -> list:
+        """Return (date, yaml_type, title, kind, value) rows for query.
+
+        Matching is case-insensitive and exact, '*' matches any characters.
+        """
+        value = query.strip().lower()
+        op = "="
+        if "*" in value:
+            op = "LIKE"
+            value = value.replace("%", r"\%").replace("_", r"\_").replace("*", "%")
+        sql = (
+            "SELECT d.date, d.yaml_type, d.title, r.kind, r.value "
+            "FROM refs r JOIN documents d ON d.key = r.key "
+            f"WHERE r.value {op} ?" + (r" ESCAPE '\'" if op == "LIKE" else "")
+        )
+        params = [value]
+        if kind:
+            sql += " AND r.kind = ?"
+            params.append(kind)
+        sql += " ORDER BY d.date DESC, d.title"
+        return self.conn.execute(sql, params).fetchall()
+
+    def overlapping(self, start: str, end: str, refs: set = frozenset()) -> list:
+        """Return archived changes whose window overlaps start to end.
+
+        Rows are (date, yaml_type, title, start, end, shared), where shared
+        lists the refs, as 'kind: value', the change has in common with refs.
+        Only windows starting within MAX_WINDOW before start can overlap, so
+        the lookup is a range scan of windows_start.
+
+        args:
+          start, end: 'YYYY-MM-DDTHH:MM'
+          refs: (kind, value) pairs from document_refs
+        """
+        earliest = datetime.fromisoformat(start) - MAX_WINDOW
+        rows = self.conn.execute(
+            "SELECT d.key, d.date, d.yaml_type, d.title, w.start, w.end "
+            "FROM windows w JOIN documents d ON d.key = w.key "
+            "WHERE w.start >= ? AND w.start < ? AND w.end > ? "
+            "ORDER BY w.start, d.title",
+            (earliest.isoformat(timespec="minutes"), end, start),
+        ).fetchall()
+        wanted = {(kind, value) for kind, value in refs if kind in CONFLICT_KINDS}
+        results = []
+        for key, *row in rows:
+            shared = sorted(
+                f"{kind}: {value}"
+                for kind, value in self.conn.execute(
+                    "SELECT kind, value FROM refs WHERE key = ?", (key,)
+                )
+                if (kind, value) in wanted
+            )
+            results.append((*row, shared))
+        return results
+
+    def calendar_events(
+        self, day: date, fetch: Callable[[date], list], ttl: int = EVENTS_TTL
+    ) -> list:
+        """Return (summary, start, end) of Internal Calendar events on day.
+
+        Events are served from the index for ttl seconds after fetch(day)
+        last returned them.
+        """
+        fetched = self.conn.execute(
+            "SELECT fetched FROM event_days WHERE day = ?", (day.isoformat(),)
+        ).fetchone()
+        if not fetched or time.time() - fetched[0] >= ttl:
+            events = fetch(day)
+            with self.conn:
+                self.conn.execute(
+                    "DELETE FROM events WHERE day = ?", (day.isoformat(),)
+                )
+                self.conn.executemany(
+                    "INSERT INTO events VALUES (?, ?, ?, ?)",
+                    [(day.isoformat(), *event) for event in events],
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO event_days VALUES (?, ?)",
+                    (day.isoformat(), time.time()),
+                )
+        return self.conn.execute(
+            "SELECT summary, start, end FROM events WHERE day = ? ORDER BY start",
+            (day.isoformat(),),
+        ).fetchall()
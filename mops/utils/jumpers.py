@@ -0,0 +1,356 @@
+import csv
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+import yaml
+
+from .cache import YAMLLoader
+
+# fields of a jumper step, one column each
+JUMPER_COLUMNS = (
+    "acable",
+    "alabel",
+    "acage",
+    "adevice",
+    "aport",
+    "arack",
+    "aterm",
+    "zcable",
+    "zcage",
+    "zdevice",
+    "zport",
+    "zrack",
+    "zlabel",
+    "zterm",
+)
+# NetBox cable table export headers and the jumper fields they fill
+NETBOX_COLUMNS = {
+    "label": ("alabel", "zlabel"),
+    "type": ("acable", "zcable"),
+    "side a": ("adevice",),
+    "device a": ("adevice",),
+    "termination a": ("aport",),
+    "rack a": ("arack",),
+    "location a": ("acage",),
+    "side b": ("zdevice",),
+    "device b": ("zdevice",),
+    "termination b": ("zport",),
+    "rack b": ("zrack",),
+    "location b": ("zcage",),
+}
+TERM_VALUES = {"": "", "yes": "Yes", "no": "No"}
+# top-level key archived MOPs keep their jumper_source CSVs under, by path, so
+# they render and index without the files
+TABLES_KEY = "jumper_tables"
+
+# parsed tables by absolute path or CSV digest, reused while unchanged, the
+# least recently used dropped past MAX_TABLES so a long-running daemon does
+# not keep every CSV it ever rendered
+MAX_TABLES = 64
+_TABLES: OrderedDict = OrderedDict()
+_TABLES_LOCK = threading.Lock()
+
+
+class JumperRow:
+    """One jumper of a JumperTable, read by the jumpers macro as j.acage etc."""
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table: "JumperTable", index: int):
+        self._table = table
+        self._index = index
+
+    def __getattr__(self, name: str):
+        try:
+            return self._table.columns[name][self._index]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+class JumperTable:
+    """Jumpers stored column-wise, one list of strings per jumper field.
+
+    Repeated values, ex. cage and rack, are stored once per column, so a
+    table costs a pointer per cell rather than a dict per jumper.
+    """
+
+    __slots__ = ("columns", "rows")
+
+    def __init__(self, columns: dict, rows: int):
+        self.columns = columns
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __iter__(self) -> Iterator[JumperRow]:
+        return (JumperRow(self, index) for index in range(self.rows))
+
+
+class JumperStep:
+    """A jumper_source step in the shape of a jumper step, [instructions,
+    jumper, jumper, ...], so the jumpers macro renders either."""
+
+    __slots__ = ("instructions", "table")
+
+    def __init__(self, instructions: str, table: JumperTable):
+        self.instructions = instructions
+        self.table = table
+
+    def __len__(self) -> int:
+        return len(self.table) + 1
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            return (self[index] for index in range(start, stop, step))
+        if key == 0:
+            return self.instructions
+        if not 0 < key < len(self):
+            raise IndexError(key)
+        return JumperRow(self.table, key - 1)
+
+    def __iter__(self):
+        return self[0:]
+
+
+def _header_fields(header: list) -> list:
+    """Return the jumper fields each CSV column fills.
+
+    Plain CSVs must only use jumper field names. Columns of a NetBox cable
+    export that have no jumper field are ignored.
+    """
+    names = [name.strip().lower() for name in header]
+    if any(name in NETBOX_COLUMNS and name not in JUMPER_COLUMNS for name in names):
+        return [NETBOX_COLUMNS.get(name, ()) for name in names]
+    unknown = [name for name in names if name not in JUMPER_COLUMNS]
+    if unknown:
+        raise ValueError(
+            f"Invalid jumper columns {unknown}, valid columns: {list(JUMPER_COLUMNS)}"
+        )
+    return [(name,) for name in names]
+
+
+def read_table(path: str) -> JumperTable:
+    """Read and validate a jumper CSV or NetBox cable export."""
+    try:
+        f = open(path, newline="", encoding="utf-8-sig")
+    except OSError as e:
+        raise ValueError(f"Unable to read jumper_source {path}: {e}") from None
+    with f:
+        return parse_table(f, path)
+
+
+def parse_table(f, path: str) -> JumperTable:
+    """Parse and validate jumper CSV rows from an open file.
+
+    Rows are streamed into columns and checked column-wise: every row must
+    have a value, possibly empty, for every column and aterm/zterm must be
+    Yes, No or empty.
+
+    args:
+      path: jumper_source path, for error messages
+    """
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if not header:
+        raise ValueError(f"jumper_source {path} is empty.")
+    fields = _header_fields(header)
+    columns = {field: [] for targets in fields for field in targets}
+    pools = {field: {} for field in columns}
+    rows = 0
+    for row in reader:
+        if not any(row):
+            continue
+        if len(row) != len(header):
+            raise ValueError(
+                f"{path} line {reader.line_num}: {len(row)} columns, "
+                f"header has {len(header)}."
+            )
+        for targets, value in zip(fields, row):
+            for field in targets:
+                # store each distinct value once per column
+                value = value.strip()
+                columns[field].append(pools[field].setdefault(value, value))
+        rows += 1
+
+    if not rows:
+        raise ValueError(f"jumper_source {path} has no jumpers.")
+    for field in ("aterm", "zterm"):
+        if field in columns:
+            invalid = set(pools[field]) - set(TERM_VALUES)
+            invalid = {value for value in invalid if value.lower() not in TERM_VALUES}
+            if invalid:
+                raise ValueError(
+                    f"{path} {field} must be Yes, No or empty, not {sorted(invalid)}."
+                )
+            columns[field] = [TERM_VALUES[value.lower()] for value in columns[field]]
+    return JumperTable(columns, rows)
+
+
+def source_key(path: str) -> tuple:
+    """Return (path, mtime, size) identifying the current version of a file."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path, None, None
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+def step_key(step) -> tuple:
+    """Return a key identifying the current jumpers of a jumper_source step."""
+    if len(step) > 2:
+        return step[1], hashlib.sha256(step[2].encode()).hexdigest()
+    return source_key(step[1])
+
+
+def _cached(key):
+    """Return the _TABLES entry for key, None if missing."""
+    with _TABLES_LOCK:
+        entry = _TABLES.get(key)
+        if entry is not None:
+            _TABLES.move_to_end(key)
+        return entry
+
+
+def _store(key, entry) -> None:
+    """Add or replace an entry of _TABLES, evicting the least recently used."""
+    with _TABLES_LOCK:
+        _TABLES[key] = entry
+        _TABLES.move_to_end(key)
+        while len(_TABLES) > MAX_TABLES:
+            _TABLES.popitem(last=False)
+
+
+def load_table(path: str) -> JumperTable:
+    """Return the validated table for path, parsed once per file version."""
+    key = source_key(os.path.abspath(path))
+    cached = _cached(key[0])
+    if cached and cached[0] == key:
+        return cached[1]
+    table = read_table(path)
+    # replaces the table of the file's previous version
+    _store(key[0], (key, table))
+    return table
+
+
+def step_table(step) -> JumperTable:
+    """Return the validated table of a jumper_source step.
+
+    args:
+      step: [instructions, path], or [instructions, path, CSV text] once
+        resolve_sources found the CSV stored in the document
+    """
+    if len(step) < 3:
+        return load_table(step[1])
+    key = step_key(step)
+    cached = _cached(key)
+    if cached is None:
+        cached = parse_table(io.StringIO(step[2], newline=""), step[1])
+        _store(key, cached)
+    return cached
+
+
+def jumper_step(step) -> JumperStep:
+    """Jinja filter turning a jumper_source step into a jumper step."""
+    return JumperStep(step[0], step_table(step))
+
+
+def jumper_sources(sections: dict) -> list:
+    """Return the [instructions, path(, CSV text)] of every jumper_source step
+    in sections."""
+    return [
+        step["jumper_source"]
+        for steps in sections.values()
+        for step in steps or []
+        if isinstance(step, dict) and "jumper_source" in step
+    ]
+
+
+def resolve_sources(data, base_dir: Optional[str] = None):
+    """Return data with its jumper_source steps ready to load.
+
+    Steps whose CSV is stored under TABLES_KEY get it as a third element,
+    other relative paths are made relative to base_dir, the YAML file's
+    directory. data is shared with YAMLCache so it is not modified, affected
+    sections are copied instead.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("sections"), dict):
+        return data
+    tables = data.get(TABLES_KEY) or {}
+    sections = {}
+    for name, steps in data["sections"].items():
+        if not any(
+            isinstance(step, dict) and "jumper_source" in step for step in steps or []
+        ):
+            sections[name] = steps
+            continue
+        sections[name] = resolved = []
+        for step in steps:
+            source = isinstance(step, dict) and step.get("jumper_source")
+            if not isinstance(source, list) or len(source) != 2:
+                resolved.append(step)
+            elif isinstance(tables.get(source[1]), str):
+                resolved.append({"jumper_source": [*source, tables[source[1]]]})
+            elif base_dir and isinstance(source[1], str):
+                path = os.path.join(base_dir, source[1])
+                resolved.append({"jumper_source": [source[0], path]})
+            else:
+                resolved.append(step)
+    return {**data, "sections": sections}
+
+
+def stored_tables(data) -> list:
+    """Return the tables of a document's jumper_source steps whose CSV is
+    stored in the document, skipping any that do not parse."""
+    if not isinstance(data, dict):
+        return []
+    tables = []
+    for step in jumper_sources(resolve_sources(data).get("sections") or {}):
+        if len(step) > 2:
+            try:
+                tables.append(step_table(step))
+            except ValueError:
+                pass
+    return tables
+
+
+def inline_sources(content: bytes, base_dir: str, data=None) -> bytes:
+    """Return YAML content with its jumper_source CSVs stored under TABLES_KEY.
+
+    Used when archiving, so an archived MOP stays renderable once its CSVs
+    change or are gone. The CSVs are appended, leaving the original YAML text
+    as is, unless the document already stores some of them.
+
+    args:
+      base_dir: directory relative jumper_source paths are read from
+      data: content already parsed, ex. by YAMLCache, not modified
+    """
+    if b"jumper_source" not in content:
+        return content
+    if data is None:
+        data = yaml.load(content, Loader=YAMLLoader)
+    if not isinstance(data, dict) or not isinstance(data.get("sections"), dict):
+        return content
+    tables = data.get(TABLES_KEY) or {}
+    new = {}
+    for step in jumper_sources(data["sections"]):
+        path = step[1]
+        if path in tables or path in new:
+            continue
+        try:
+            with open(os.path.join(base_dir, path), encoding="utf-8-sig") as f:
+                new[path] = f.read()
+        except OSError as e:
+            raise ValueError(f"Unable to read jumper_source {path}: {e}") from None
+    if not new:
+        return content
+    if TABLES_KEY not in data:
+        appended = yaml.safe_dump({TABLES_KEY: new}, allow_unicode=True)
+        return content.rstrip(b"\n") + b"\n" + appended.encode()
+    data = {**data, TABLES_KEY: {**tables, **new}}
+    return yaml.safe_dump(data, allow_unicode=True, sort_keys=False).encode()
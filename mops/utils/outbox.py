@@ -0,0 +1,228 @@
+import hashlib
+import json
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Optional
+
+from .cache import CACHE_DIR
+
+# seconds before the first retry, doubled per attempt up to MAX_BACKOFF
+BASE_BACKOFF = 30
+MAX_BACKOFF = 60 * 60
+MAX_ATTEMPTS = 10
+# a job claimed by a worker that died is picked up again after LEASE seconds
+LEASE = 10 * 60
+# seconds a waiting worker sleeps at most before looking for new jobs
+POLL = 5
+# finished jobs are kept this long for 'mops outbox status'
+DONE_TTL = 7 * 24 * 60 * 60
+
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    after INTEGER REFERENCES jobs(id),
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_open_key ON jobs(key) WHERE status != 'done';
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs(status, next_attempt);
+"""
+# pending, or claimed by a worker whose lease has run out, and not waiting on
+# an unfinished job
+DUE = """
+status IN ('pending', 'running')
+AND (after IS NULL OR after NOT IN (SELECT id FROM jobs WHERE status != 'done'))
+"""
+
+
+def job_key(kind: str, *parts) -> str:
+    """Return the idempotency key for a side effect."""
+    return hashlib.sha256(json.dumps([kind, *parts]).encode()).hexdigest()
+
+
+def backoff(attempts: int) -> float:
+    """Return seconds to wait after a job's nth failed attempt, with jitter."""
+    delay = min(BASE_BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class Outbox:
+    """Persistent queue of publish side effects.
+
+    Confluence pushes, Jira links, calendar events and archive moves are
+    written here and run by a worker, so a slow or unreachable API neither
+    blocks the terminal nor loses the step. Failed jobs are retried with
+    exponential backoff, and a job only runs once the job it depends on is
+    done. Each job carries an idempotency key, passed to its handler so a
+    retry after a lost response does not repeat the side effect.
+    """
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = Path(db_path) if db_path else CACHE_DIR / "outbox.sqlite3"
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.conn.executescript("DROP TABLE IF EXISTS jobs;")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def enqueue(
+        self, kind: str, payload: dict, key: str, after: Optional[int] = None
+    ) -> int:
+        """Queue a job and return its id.
+
+        A job whose key matches an unfinished job is not queued twice, the
+        existing job's id is returned instead.
+
+        args:
+          kind: handler name, ex. 'confluence'
+          payload: JSON serializable handler arguments
+          key: idempotency key, see job_key
+          after: id of a job that must be done first
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO jobs "
+                "(key, kind, payload, after, next_attempt, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, json.dumps(payload), after, now, now),
+            )
+            return self.conn.execute(
+                "SELECT id FROM jobs WHERE key = ? AND status != 'done'", (key,)
+            ).fetchone()["id"]
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Lease the oldest due job to this worker."""
+        while True:
+            now = time.time()
+            job = self.conn.execute(
+                f"SELECT * FROM jobs WHERE {DUE} AND next_attempt <= ? "
+                "ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if job is None:
+                return None
+            with self.conn:
+                claimed = self.conn.execute(
+                    "UPDATE jobs SET status = 'running', next_attempt = ?, "
+                    "updated = ? WHERE id = ? AND next_attempt = ?",
+                    (now + LEASE, now, job["id"], job["next_attempt"]),
+                ).rowcount
+            # another worker may have claimed it between the two statements
+            if claimed:
+                return job
+
+    def flush(self, handlers: dict) -> dict:
+        """Run every due job once.
+
+        args:
+          handlers: dict of kind: callable(payload, key)
+        Returns dict of 'done', 'retry' and 'failed' job counts.
+        """
+        counts = {"done": 0, "retry": 0, "failed": 0}
+        while True:
+            job = self._claim()
+            if job is None:
+                break
+            handler: Callable = handlers[job["kind"]]
+            try:
+                handler(json.loads(job["payload"]), job["key"])
+            except (Exception, SystemExit) as e:
+                attempts = job["attempts"] + 1
+                status = "failed" if attempts >= MAX_ATTEMPTS else "pending"
+                error = f"{type(e).__name__}: {e}"
+                with self.conn:
+                    self.conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = ?, "
+                        "next_attempt = ?, error = ?, updated = ? WHERE id = ?",
+                        (
+                            status,
+                            attempts,
+                            time.time() + backoff(attempts),
+                            error,
+                            time.time(),
+                            job["id"],
+                        ),
+                    )
+                counts["failed" if status == "failed" else "retry"] += 1
+                print(f"\t{job['kind']} job {job['id']}: {error}")
+            else:
+                with self.conn:
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'done', error = NULL, "
+                        "updated = ? WHERE id = ?",
+                        (time.time(), job["id"]),
+                    )
+                counts["done"] += 1
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM jobs WHERE status = 'done' AND updated < ?",
+                (time.time() - DONE_TTL,),
+            )
+        return counts
+
+    def next_due(self) -> Optional[float]:
+        """Return seconds until the next job is due, None if none can run."""
+        row = self.conn.execute(
+            f"SELECT MIN(next_attempt) FROM jobs WHERE {DUE}"
+        ).fetchone()
+        return None if row[0] is None else max(row[0] - time.time(), 0)
+
+    def jobs(self, include_done: bool = False) -> list:
+        """Return queued jobs, oldest first."""
+        where = "" if include_done else "WHERE status != 'done'"
+        return self.conn.execute(f"SELECT * FROM jobs {where} ORDER BY id").fetchall()
+
+    def retry(self) -> int:
+        """Queue failed jobs again and return how many."""
+        with self.conn:
+            return self.conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, "
+                "next_attempt = ?, updated = ? WHERE status = 'failed'",
+                (time.time(), time.time()),
+            ).rowcount
+
+    @contextmanager
+    def worker_lock(self):
+        """Hold the outbox worker lock if no other worker does.
+
+        Yields whether the lock was taken. A worker that is already running
+        picks up newly queued jobs, so there is no point waiting for it.
+        Without fcntl, ex. on Windows, the lock is always taken.
+        """
+        try:
+            import fcntl
+        except ImportError:
+            yield True
+            return
+        with open(self.db_path.with_suffix(".lock"), "w") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
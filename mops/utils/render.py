@@ -0,0 +1,111 @@
+import copy
+from typing import Optional
+
+from .jumpers import jumper_sources, step_key
+from .templates import environment
+
+# lists a split MOP's section pages, in title order, on the parent page
+CHILDREN_MACRO = "\nh1. Sections\n{children:sort=title}\n"
+
+
+class IncrementalRenderer:
+    """Re-render a MOP one section at a time, reusing unchanged output.
+
+    mop.j2 is rendered as its header block, one mop_section.j2 section macro
+    call per entry in sections, and its footer block. A section is reused when
+    its title, position, steps and jumper_source files are unchanged and
+    either its first jumper number is unchanged or it contains no jumpers, so
+    the global jumper count stays correct.
+    """
+
+    def __init__(self):
+        self.env = environment("renderers")
+        self._shell = None
+        self._shell_output = ("", "")
+        self._sections: dict = {}
+        self.rendered = 0
+        self.reused = 0
+
+    def _render_shell(self, data: dict) -> tuple:
+        """Return (header, footer), re-rendered only if non-section data changed."""
+        shell = {k: v for k, v in data.items() if k != "sections"}
+        if shell != self._shell:
+            template = self.env.get_template("mop.j2")
+            context = template.new_context(data)
+            self._shell_output = tuple(
+                "".join(template.blocks[block](context))
+                for block in ("header", "footer")
+            )
+            self._shell = shell
+        return self._shell_output
+
+    def render_parts(self, data: dict) -> tuple:
+        """Return (header, [(section name, section text)], footer)."""
+        header, footer = self._render_shell(data)
+        module = None
+        jumper = 1
+        self.rendered = self.reused = 0
+        sections = {}
+        parts = []
+        for index, (name, steps) in enumerate(data["sections"].items(), start=1):
+            cached = self._sections.get((index, name))
+            sources = [step_key(step) for step in jumper_sources({name: steps})]
+            if (
+                cached
+                and cached["steps"] == steps
+                and cached["sources"] == sources
+                and (cached["start"] == jumper or cached["jumpers"] == 0)
+            ):
+                self.reused += 1
+                entry = cached
+            else:
+                if module is None:
+                    module = self.env.get_template("mop_section.j2").make_module(
+                        vars=data
+                    )
+                # jinja Namespace only accepts item assignment from Python
+                module.count["value"] = jumper
+                text = str(module.section(index, name, steps))
+                entry = {
+                    # snapshot, so edits made in place are still detected
+                    "steps": copy.deepcopy(steps),
+                    "sources": sources,
+                    "start": jumper,
+                    "jumpers": module.count.value - jumper,
+                    "text": text,
+                }
+                self.rendered += 1
+            sections[(index, name)] = entry
+            jumper += entry["jumpers"]
+            parts.append((name, entry["text"]))
+        self._sections = sections
+        return header, parts, footer
+
+    def render(self, data: dict) -> str:
+        """Return the same output as render_yaml(data, 'mop')."""
+        header, parts, footer = self.render_parts(data)
+        return header + "".join(text for _, text in parts) + footer
+
+
+def child_title(page_title: str, index: int, count: int, name: str) -> str:
+    """Return the child page title for a MOP section.
+
+    Indexes are zero padded so Confluence's title order is section order.
+    """
+    return f"{page_title} {index:0{len(str(count))}d} - {name}"
+
+
+def split_mop(data: dict, renderer: Optional[IncrementalRenderer] = None) -> tuple:
+    """Render a MOP as a parent page plus one child page per section.
+
+    The parent keeps the header and footer and lists the sections with the
+    Confluence children macro. Jumper numbering continues across sections.
+
+    Returns (parent body, [(child title, child body)]).
+    """
+    header, parts, footer = (renderer or IncrementalRenderer()).render_parts(data)
+    children = [
+        (child_title(data["page_title"], index, len(parts), name), text)
+        for index, (name, text) in enumerate(parts, start=1)
+    ]
+    return header + CHILDREN_MACRO + footer, children
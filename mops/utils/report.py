@@ -0,0 +1,238 @@
+import gzip
+import json
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Optional
+
+import yaml
+
+from .archive import ArchiveStore
+from .cache import CACHE_DIR, YAMLLoader
+from .jumpers import stored_tables
+
+# bump when document_stats changes, cached partial results are then discarded
+STATS_VERSION = 3
+METRICS = (
+    "changes_per_month",
+    "mops_per_month",
+    "cds_per_month",
+    "mops_per_executing_dep",
+    "mops_per_level",
+    "jumpers_per_site",
+    "mops_per_partial_rollback",
+    "validation",
+)
+
+
+def count_jumpers(data: dict) -> int:
+    """Return the number of jumpers in a MOP's jumper and stored jumper_source
+    steps."""
+    listed = sum(
+        len(step["jumper"]) - 1
+        for steps in (data.get("sections") or {}).values()
+        for step in steps or []
+        if isinstance(step, dict) and isinstance(step.get("jumper"), list)
+    )
+    return listed + sum(len(table) for table in stored_tables(data))
+
+
+def document_stats(data: dict, yaml_type: str) -> dict:
+    """Return the statistics of one document, independent of its archive date."""
+    stats = {"yaml_type": yaml_type, "valid": validate(data, yaml_type)}
+    if yaml_type == "mop":
+        stats.update(
+            executing_dep=str(data.get("executing_dep") or "unknown"),
+            level=str(data.get("level", "unknown")),
+            site=str(data.get("rh") or "unknown"),
+            jumpers=count_jumpers(data),
+            partial_rollback=bool(data.get("partial_rollback")),
+        )
+    return stats
+
+
+def validate(data: dict, yaml_type: str) -> Optional[bool]:
+    """Return whether data passes MOPModel/CDModel, None if it cannot be
+    checked because the Jira project keys are unknown.
+
+    Paths are not checked, archives are shared between machines.
+    """
+    from pydantic import ValidationError
+
+    from .schema import JIRA_PROJECTS, ArchivedCDModel, ArchivedMOPModel
+
+    if JIRA_PROJECTS.cached() is None:
+        return None
+    try:
+        ArchivedMOPModel(**data) if yaml_type == "mop" else ArchivedCDModel(**data)
+    except (ValidationError, SystemExit, TypeError):
+        return False
+    return True
+
+
+def _init_worker(projects: Optional[frozenset]) -> None:
+    """Validate tickets against the parent's project keys, not Jira."""
+    from .schema import JIRA_PROJECTS
+
+    JIRA_PROJECTS.seed(projects)
+
+
+def blob_stats(job: tuple) -> tuple:
+    """Return (blob, stats) for an archived blob, run in a worker process.
+
+    Unreadable documents get {'yaml_type': ..., 'error': message}.
+    """
+    blob, path, yaml_type = job
+    try:
+        with gzip.open(path, "rb") as f:
+            data = yaml.load(f.read(), Loader=YAMLLoader)
+        if not isinstance(data, dict):
+            raise ValueError("not a YAML mapping")
+        return blob, document_stats(data, yaml_type)
+    except Exception as e:
+        return blob, {"yaml_type": yaml_type, "error": f"{type(e).__name__}: {e}"}
+
+
+class Report:
+    """Archive statistics, aggregated one document at a time."""
+
+    def __init__(self):
+        self.metrics = {metric: Counter() for metric in METRICS}
+        self.documents = 0
+
+    def add(self, entry: dict, stats: dict) -> None:
+        """Aggregate one archived document.
+
+        args:
+          entry: ArchiveStore manifest entry, for its date
+          stats: document_stats result
+        """
+        self.documents += 1
+        m = self.metrics
+        month = entry["date"][:7]
+        m["changes_per_month"][month] += 1
+        if "error" in stats:
+            m["validation"]["unreadable"] += 1
+            return
+        m["validation"][
+            {True: "valid", False: "invalid", None: "unchecked"}[stats["valid"]]
+        ] += 1
+        if stats["yaml_type"] == "cd":
+            m["cds_per_month"][month] += 1
+            return
+        m["mops_per_month"][month] += 1
+        m["mops_per_executing_dep"][stats["executing_dep"]] += 1
+        m["mops_per_level"][stats["level"]] += 1
+        m["jumpers_per_site"][stats["site"]] += stats["jumpers"]
+        m["mops_per_partial_rollback"][
+            "yes" if stats["partial_rollback"] else "no"
+        ] += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "documents": self.documents,
+            **{metric: dict(sorted(c.items())) for metric, c in self.metrics.items()},
+        }
+
+    def rows(self) -> list:
+        """Return (metric, key, value) rows, for CSV output."""
+        return [
+            (metric, key, value)
+            for metric, counts in self.as_dict().items()
+            if isinstance(counts, dict)
+            for key, value in counts.items()
+        ]
+
+
+class PartialsCache:
+    """Per-blob document_stats results, so re-runs only read new documents.
+
+    Archive blobs are named by the sha256 of their content and never change,
+    so a blob's statistics only need computing once.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else CACHE_DIR / "report_partials.json"
+        self.partials: dict = {}
+        try:
+            with open(self.path, "r") as f:
+                cached = json.load(f)
+            if cached.get("version") == STATS_VERSION:
+                self.partials = cached["partials"]
+        except (OSError, ValueError):
+            pass
+
+    def save(self) -> None:
+        """Atomically write the partial results."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"version": STATS_VERSION, "partials": self.partials}, f)
+        os.replace(tmp, self.path)
+
+
+def build_report(
+    stores: Iterable[ArchiveStore],
+    workers: int = os.cpu_count() or 1,
+    cache: Optional[PartialsCache] = None,
+) -> tuple:
+    """Aggregate every document in stores.
+
+    Documents without cached statistics are parsed and validated in a pool
+    of worker processes, and aggregated as each result comes back rather than
+    held until all are done.
+    Returns (Report, number of documents read).
+    """
+    from .schema import JIRA_PROJECTS
+
+    cache = cache or PartialsCache()
+    report = Report()
+    todo: dict = {}
+    for store in stores:
+        for entry in store.entries():
+            stats = cache.partials.get(entry["blob"])
+            if stats is not None:
+                report.add(entry, stats)
+            else:
+                todo.setdefault(entry["blob"], (store, []))[1].append(entry)
+    if not todo:
+        return report, 0
+
+    try:
+        projects = JIRA_PROJECTS.get()
+    except Exception as e:
+        # stderr, so CSV or JSON on stdout stays parseable
+        print(
+            f"\tUnable to load Jira projects ({e}), skipping validation.",
+            file=sys.stderr,
+        )
+        projects = None
+    jobs = [
+        (blob, str(store.blob_path(blob)), entries[0]["yaml_type"])
+        for blob, (store, entries) in todo.items()
+    ]
+    if workers > 1 and len(jobs) > 1:
+        pool = ProcessPoolExecutor(
+            min(workers, len(jobs)), initializer=_init_worker, initargs=(projects,)
+        )
+        results = pool.map(
+            blob_stats, jobs, chunksize=max(len(jobs) // (workers * 4), 1)
+        )
+    else:
+        pool = None
+        _init_worker(projects)
+        results = map(blob_stats, jobs)
+    try:
+        for blob, stats in results:
+            for entry in todo[blob][1]:
+                report.add(entry, stats)
+            # unchecked results are recomputed once Jira projects are known
+            if stats.get("valid", True) is not None:
+                cache.partials[blob] = stats
+    finally:
+        if pool:
+            pool.shutdown()
+    cache.save()
+    return report, len(jobs)
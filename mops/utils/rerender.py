@@ -0,0 +1,198 @@
+import difflib
+import gzip
+import hashlib
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional
+
+import yaml
+
+from .cache import CACHE_DIR, YAMLLoader
+from .jumpers import resolve_sources
+from .templates import PACKAGE_DIR, environment
+
+# renderer templates each document type depends on
+TEMPLATES = {"mop": ("mop.j2", "mop_section.j2"), "cd": ("cd.j2",)}
+
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS renders (
+    page TEXT PRIMARY KEY,
+    yaml_type TEXT NOT NULL,
+    template TEXT NOT NULL,
+    split INTEGER NOT NULL,
+    body BLOB NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+def template_hash(yaml_type: str) -> str:
+    """Return the sha256 of the renderer templates for yaml_type."""
+    digest = hashlib.sha256()
+    for name in TEMPLATES[yaml_type]:
+        digest.update(name.encode())
+        digest.update((PACKAGE_DIR / "renderers" / name).read_bytes())
+    return digest.hexdigest()
+
+
+def page_key(parent_page_id, page_title: str) -> str:
+    return f"{parent_page_id}/{page_title}"
+
+
+def rendered_text(body: str, children: Optional[list] = None) -> str:
+    """Return a page's full output, including split MOP child pages."""
+    return "\n".join([body, *(f"{title}\n{text}" for title, text in children or [])])
+
+
+class RenderLog:
+    """The body and template hash each Confluence page was last published with.
+
+    Lets 'mops rerender' find pages published with an older template, and
+    diff a new render against what is on the page.
+    """
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = Path(db_path) if db_path else CACHE_DIR / "renders.sqlite3"
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.conn.executescript("DROP TABLE IF EXISTS renders;")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(
+        self,
+        parent_page_id,
+        page_title: str,
+        yaml_type: str,
+        body: str,
+        split: bool = False,
+    ) -> None:
+        """Record a page as published with the current templates.
+
+        args:
+          body: rendered_text of the page
+        """
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO renders VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    page_key(parent_page_id, page_title),
+                    yaml_type,
+                    template_hash(yaml_type),
+                    int(split),
+                    gzip.compress(body.encode()),
+                    time.time(),
+                ),
+            )
+
+    def templates(self) -> dict:
+        """Return {page key: (template hash, split)} for every page."""
+        return {
+            page: (template, bool(split))
+            for page, template, split in self.conn.execute(
+                "SELECT page, template, split FROM renders"
+            )
+        }
+
+    def body(self, parent_page_id, page_title: str) -> Optional[str]:
+        """Return the rendered_text a page was last published with."""
+        row = self.conn.execute(
+            "SELECT body FROM renders WHERE page = ?",
+            (page_key(parent_page_id, page_title),),
+        ).fetchone()
+        return gzip.decompress(row[0]).decode() if row else None
+
+
+def diff_stats(old: str, new: str) -> tuple:
+    """Return (lines added, lines removed) from old to new."""
+    added = removed = 0
+    for line in difflib.unified_diff(old.splitlines(), new.splitlines(), n=0):
+        if line.startswith("+") and not line.startswith("+++"):
+            added += 1
+        elif line.startswith("-") and not line.startswith("---"):
+            removed += 1
+    return added, removed
+
+
+# set in each worker process by _init_worker
+_CURRENT: dict = {}
+_PUBLISHED: dict = {}
+
+
+def _init_worker(current: dict, published: dict) -> None:
+    _CURRENT.update(current)
+    _PUBLISHED.update(published)
+
+
+def render_archived(job: tuple) -> Optional[dict]:
+    """Render an archived YAML if its page used other templates, run in a
+    worker process.
+
+    args:
+      job: (archive title, YAML bytes, yaml_type, re-render even if current)
+    Returns None for a current page, otherwise a dict of parent_page_id,
+    page_title, yaml_type, split, body and children, or of title and error.
+    """
+    from .render import split_mop
+
+    title, content, yaml_type, rerender_all = job
+    try:
+        # archived MOPs carry their jumper_source CSVs
+        data = resolve_sources(yaml.load(content, Loader=YAMLLoader))
+        key = page_key(data["parent_page_id"], data["page_title"])
+        template, split = _PUBLISHED.get(key, (None, False))
+        if template == _CURRENT[yaml_type] and not rerender_all:
+            return None
+        if split and yaml_type == "mop":
+            body, children = split_mop(data)
+        else:
+            renderer = environment("renderers").get_template(f"{yaml_type}.j2")
+            body, children = renderer.render(data), None
+    except Exception as e:
+        return {"title": title, "error": f"{type(e).__name__}: {e}"}
+    return {
+        "parent_page_id": data["parent_page_id"],
+        "page_title": data["page_title"],
+        "yaml_type": yaml_type,
+        "split": split,
+        "body": body,
+        "children": children,
+    }
+
+
+def render_stale(
+    documents: list, published: dict, workers: int, rerender_all: bool = False
+) -> Iterator[dict]:
+    """Render, in a process pool, the documents whose page was published
+    with other templates, yielding render_archived results.
+
+    args:
+      documents: (archive title, YAML bytes, yaml_type)
+      published: RenderLog.templates()
+      rerender_all: also render documents published with current templates
+    """
+    current = {yaml_type: template_hash(yaml_type) for yaml_type in TEMPLATES}
+    jobs = [(*document, rerender_all) for document in documents]
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(
+            min(workers, len(jobs)),
+            initializer=_init_worker,
+            initargs=(current, published),
+        ) as pool:
+            yield from filter(None, pool.map(render_archived, jobs))
+    else:
+        _init_worker(current, published)
+        yield from filter(None, map(render_archived, jobs))
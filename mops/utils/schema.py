@@ -13,26 +13,21 @@ from pydantic import (
     validator,
 )
 
-from .atlassian import Atlassian
-
-JIRA_PROJECTS_LIST = Atlassian().jira_projects_list()
-
-VALID_JUMPER_ITEMS = [
-    "acable",
-    "alabel",
-    "acage",
-    "adevice",
-    "aport",
-    "arack",
-    "aterm",
-    "zcable",
-    "zcage",
-    "zdevice",
-    "zport",
-    "zrack",
-    "zlabel",
-    "zterm",
-]
+from .cache import JIRA_PROJECTS, JIRA_TICKETS  # noqa: F401 re-exported
+from .jumpers import JUMPER_COLUMNS, step_table
+
+# well-formed ticket keys, others are left to schema validation rather than
+# sent to Jira, where one bad key fails the whole search
+TICKET_KEY = re.compile(r"^[A-Z][A-Z0-9]+-\d+$")
+
+
+def ticket_keys(data: dict) -> set:
+    """Return the well-formed Jira ticket keys a MOP or CD references."""
+    keys = {data.get("ticket"), data.get("approval"), *(data.get("shipping") or {})}
+    return {key for key in keys if isinstance(key, str) and TICKET_KEY.match(key)}
+
+
+VALID_JUMPER_ITEMS = list(JUMPER_COLUMNS)
 
 
 class SectionOptions(str, Enum):
@@ -47,6 +42,7 @@ class SectionOptions(str, Enum):
     EXPAND_CORE = "expand_core"
     EXPAND_NOC = "expand_noc"
     JUMPER = "jumper"
+    JUMPER_SOURCE = "jumper_source"
     NOTE = "note"
 
     @classmethod
@@ -81,7 +77,7 @@ class BaseYAML(BaseModel):
         error_msg = f"{ticket} must be a valid ticket number."
         assert ticket[3] == "-", error_msg
         assert ticket[4:].isdigit(), error_msg
-        assert ticket[:3] in JIRA_PROJECTS_LIST, error_msg
+        assert ticket[:3] in JIRA_PROJECTS.get(), error_msg
         return ticket
 
 
@@ -154,6 +150,8 @@ class MOPModel(BaseYAML):
     rh_equip: Optional[list]
     shipping: Optional[dict[str, list]]
     sections: dict[str, list]
+    # jumper_source CSVs stored when archived, by path
+    jumper_tables: Optional[dict[str, str]]
 
     @validator("ticket", "approval")
     def check_tickets_model(cls, ticket):
@@ -195,9 +193,33 @@ class MOPModel(BaseYAML):
                                     item in VALID_JUMPER_ITEMS
                                 ), f"Valid Jumper options: {VALID_JUMPER_ITEMS}."
 
+                    elif section_header == "jumper_source":
+                        # ex: '{jumper_source: [Run jumpers, cables.csv]}', the
+                        # CSV text is added once found under jumper_tables
+                        assert (
+                            isinstance(section_value, list)
+                            and len(section_value) in (2, 3)
+                            and all(isinstance(i, str) for i in section_value)
+                        ), "jumper_source must be [instructions, CSV path]."
+                        step_table(section_value)
+
                     elif isinstance(section_value, list):
                         # check multi-line vars
                         for i in section_value:
                             assert isinstance(
                                 i, str
                             ), f"Line is not a string: \n\n{i}\n\n"
+
+
+class ArchivedMOPModel(MOPModel):
+    """MOPModel for archived documents, whose paths may only exist on the
+    machine they were published from."""
+
+    repository: str
+
+
+class ArchivedCDModel(CDModel):
+    """CDModel for archived documents, see ArchivedMOPModel."""
+
+    repository: str
+    gcal_auth_path: Optional[str] = None
@@ -0,0 +1,179 @@
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, fields
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .timing import PROFILER
+
+# the server did not act on the request, so any method may be retried
+THROTTLE_STATUSES = (429, 503)
+# also retried for methods that are safe to repeat
+RETRY_STATUSES = THROTTLE_STATUSES + (502, 504)
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+
+
+@dataclass(frozen=True)
+class HTTPConfig:
+    """Connection pool, timeout, retry and rate limit settings.
+
+    from_env() reads overrides from MOPS_HTTP_{FIELD} environment variables,
+    ex. MOPS_HTTP_RATE=2.
+    """
+
+    pool_size: int = 10
+    timeout: float = 30.0
+    retries: int = 5
+    backoff: float = 0.5
+    max_backoff: float = 30.0
+    # requests per second per host, 0 disables rate limiting
+    rate: float = 10.0
+    burst: int = 10
+
+    @classmethod
+    def from_env(cls) -> "HTTPConfig":
+        overrides = {}
+        for field in fields(cls):
+            value = os.environ.get(f"MOPS_HTTP_{field.name.upper()}")
+            if value is not None:
+                overrides[field.name] = type(field.default)(value)
+        return cls(**overrides)
+
+
+class TokenBucket:
+    """Allow rate calls per second on average, and bursts of up to burst."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, sleeping until it is available. Returns seconds slept."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # reserve the token now so waiting threads are served in order
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available now, without waiting."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+# one bucket per host, shared by every session in the process
+_BUCKETS: dict = {}
+_BUCKETS_LOCK = threading.Lock()
+
+
+def host_bucket(host: str, config: HTTPConfig) -> TokenBucket:
+    with _BUCKETS_LOCK:
+        if host not in _BUCKETS:
+            _BUCKETS[host] = TokenBucket(config.rate, config.burst)
+        return _BUCKETS[host]
+
+
+def retry_after(response: requests.Response) -> Optional[float]:
+    """Return seconds requested by a Retry-After header, if any."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class PooledSession(requests.Session):
+    """requests Session with pooled keep-alive connections, a default timeout,
+    per-host rate limiting and retries.
+
+    Throttled requests (429, 503) are retried for any method, waiting as long
+    as Retry-After asks, up to max_backoff, or else backing off exponentially
+    with full jitter.
+    Gateway errors, timeouts and dropped connections are only retried for
+    idempotent methods, or when the connection was never made. A throttled
+    response returned once retries are spent has no Retry-After header.
+    Latency and retries per host are recorded in PROFILER.
+    """
+
+    def __init__(self, config: Optional[HTTPConfig] = None):
+        super().__init__()
+        self.config = config or HTTPConfig.from_env()
+        adapter = HTTPAdapter(
+            pool_connections=self.config.pool_size,
+            pool_maxsize=self.config.pool_size,
+        )
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def backoff(self, attempt: int) -> float:
+        """Return a random delay of up to backoff * 2^attempt seconds."""
+        ceiling = min(self.config.backoff * 2**attempt, self.config.max_backoff)
+        return random.uniform(0, ceiling)
+
+    def request(self, method, url, *args, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.config.timeout
+        host = urlsplit(url).hostname or url
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        statuses = RETRY_STATUSES if idempotent else THROTTLE_STATUSES
+        attempt = 0
+        while True:
+            if self.config.rate > 0:
+                host_bucket(host, self.config).acquire()
+            start = time.perf_counter()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                PROFILER.record_http(host, time.perf_counter() - start)
+                unsent = isinstance(e, requests.exceptions.ConnectTimeout)
+                if attempt >= self.config.retries or not (idempotent or unsent):
+                    raise
+                delay = self.backoff(attempt)
+            else:
+                PROFILER.record_http(host, time.perf_counter() - start)
+                if response.status_code not in statuses:
+                    return response
+                if attempt >= self.config.retries:
+                    # retries are spent, do not let the Atlassian clients
+                    # start their own unbounded Retry-After loop
+                    response.headers.pop("Retry-After", None)
+                    return response
+                delay = retry_after(response)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                else:
+                    delay = min(delay, self.config.max_backoff)
+                response.close()
+            attempt += 1
+            PROFILER.count_retry(host)
+            time.sleep(delay)
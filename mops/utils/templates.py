@@ -0,0 +1,32 @@
+from functools import lru_cache
+from pathlib import Path
+
+from .cache import CACHE_DIR
+from .jumpers import jumper_step
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent
+
+
+@lru_cache(maxsize=None)
+def environment(directory: str):
+    """Return the shared Jinja Environment for a package template directory.
+
+    Compiled templates are kept in memory for the life of the process and as
+    bytecode on disk between runs. Jinja checks template mtimes and source
+    checksums, so editing a .j2 file invalidates both.
+
+    args:
+      directory: 'renderers' or 'defaults'
+    """
+    from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+    bytecode_dir = CACHE_DIR / "jinja"
+    bytecode_dir.mkdir(parents=True, exist_ok=True)
+    env = Environment(
+        loader=FileSystemLoader(str(PACKAGE_DIR / directory)),
+        bytecode_cache=FileSystemBytecodeCache(str(bytecode_dir)),
+        trim_blocks=True,
+        lstrip_blocks=True,
+    )
+    env.filters["jumper_step"] = jumper_step
+    return env
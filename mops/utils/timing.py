@@ -0,0 +1,151 @@
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+from urllib.parse import urlsplit
+
+
+def latency_summary(seconds: list) -> dict:
+    """Return request count and p50/p95/max of a list of latencies."""
+    ordered = sorted(seconds)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(int(len(ordered) * p), len(ordered) - 1)], 6)
+
+    return {
+        "requests": len(ordered),
+        "p50": percentile(0.5),
+        "p95": percentile(0.95),
+        "max": round(ordered[-1], 6),
+    }
+
+
+class Profiler:
+    """Wall-clock time per phase and HTTP calls per host for one mops run.
+
+    Phases are always recorded, which costs a couple of perf_counter calls.
+    HTTP calls are only counted once enable() has patched the requests and
+    httplib2 transports used by the Atlassian and Google clients. Latency and
+    retries of requests sent through a PooledSession are also only recorded
+    once enabled, so a long-running 'mops serve' does not keep every latency.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.phases: dict[str, list] = {}
+        self.http: Counter = Counter()
+        self.latency: dict[str, list] = {}
+        self.retries: Counter = Counter()
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block under name, accumulating repeat calls."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                entry = self.phases.setdefault(name, [0, 0.0])
+                entry[0] += 1
+                entry[1] += elapsed
+
+    def count_http(self, url: str) -> None:
+        with self._lock:
+            self.http[urlsplit(url).hostname or url] += 1
+
+    def record_http(self, host: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.latency.setdefault(host, []).append(seconds)
+
+    def count_retry(self, host: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.retries[host] += 1
+
+    def enable(self) -> None:
+        """Start counting HTTP requests made through requests and httplib2."""
+        if self.enabled:
+            return
+        self.enabled = True
+
+        import requests
+
+        send = requests.Session.send
+
+        def counted_send(session, request, **kwargs):
+            self.count_http(request.url)
+            return send(session, request, **kwargs)
+
+        requests.Session.send = counted_send
+
+        try:
+            import httplib2
+        except ImportError:
+            return
+        http_request = httplib2.Http.request
+
+        def counted_request(http, uri, *args, **kwargs):
+            self.count_http(uri)
+            return http_request(http, uri, *args, **kwargs)
+
+        httplib2.Http.request = counted_request
+
+    def summary(self) -> dict:
+        """Return phase timings and HTTP counts as a JSON-serializable dict."""
+        with self._lock:
+            return {
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "argv": sys.argv[1:],
+                "total": round(time.perf_counter() - self._start, 6),
+                "phases": {
+                    name: {"calls": calls, "seconds": round(seconds, 6)}
+                    for name, (calls, seconds) in self.phases.items()
+                },
+                "http": dict(self.http),
+                "latency": {
+                    host: latency_summary(seconds)
+                    for host, seconds in self.latency.items()
+                },
+                "retries": dict(self.retries),
+            }
+
+    def report(self, json_path: Optional[str] = None) -> None:
+        """Print a summary table, and append it as a JSON line if json_path."""
+        summary = self.summary()
+        print(f"\n{'Phase':<20}{'Calls':>8}{'Seconds':>12}")
+        for name, phase in summary["phases"].items():
+            print(f"{name:<20}{phase['calls']:>8}{phase['seconds']:>12.4f}")
+        print(f"{'total':<20}{'':>8}{summary['total']:>12.4f}")
+        if summary["http"]:
+            print(f"\n{'HTTP host':<40}{'Calls':>8}")
+            for host, calls in sorted(summary["http"].items()):
+                print(f"{host:<40}{calls:>8}")
+        if summary["latency"]:
+            print(
+                f"\n{'HTTP host':<40}{'Requests':>10}{'Retries':>9}"
+                f"{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}"
+            )
+            for host, latency in sorted(summary["latency"].items()):
+                print(
+                    f"{host:<40}{latency['requests']:>10}"
+                    f"{summary['retries'].get(host, 0):>9}"
+                    f"{latency['p50'] * 1000:>9.1f}{latency['p95'] * 1000:>9.1f}"
+                    f"{latency['max'] * 1000:>9.1f}"
+                )
+
+        if json_path:
+            with open(json_path, "a") as f:
+                f.write(json.dumps(summary) + "\n")
+
+
+PROFILER = Profiler()